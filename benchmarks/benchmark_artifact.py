@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import click
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+
+# Run in a fresh interpreter per measurement, so imports and loading start cold (the OS page cache stays warm)
+COLD_START = '''
+import sys, time, json, resource
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from {module} import {cls} as Classifier
+imported = time.perf_counter()
+classifier = Classifier.load({path!r})
+loaded = time.perf_counter()
+loaded_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+classifier.predict({body!r})
+predicted = time.perf_counter()
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+unit = 1024 ** 2 if sys.platform == 'darwin' else 1024
+print(json.dumps({{'import_ms': (imported - start) * 1000, 'load_ms': (loaded - imported) * 1000,
+                  'first_predict_ms': (predicted - loaded) * 1000, 'total_ms': (predicted - start) * 1000,
+                  'loaded_rss_mb': loaded_peak / unit, 'peak_rss_mb': peak / unit}}))
+'''
+
+FORMATS = {
+    'pickle': ('src.models.pipeline', 'SpamClassifier'),
+    'compact': ('src.models.compact_artifact', 'CompactSpamClassifier'),
+}
+
+SAMPLE_BODY = "Congratulations! You have been selected to receive a free cruise. Reply now to claim your prize."
+
+
+def artifact_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def cold_start(artifact_format, path, runs):
+    """Median of each cold-start measurement over `runs` fresh interpreters."""
+    module, cls = FORMATS[artifact_format]
+    code = COLD_START.format(root=ROOT, module=module, cls=cls, path=os.path.abspath(path), body=SAMPLE_BODY)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {metric: statistics.median(sample[metric] for sample in samples)
+            for metric in ('import_ms', 'load_ms', 'first_predict_ms', 'total_ms', 'loaded_rss_mb', 'peak_rss_mb')}
+
+
+@click.command()
+@click.option('--pipeline', default='models/spam_pipeline.pkl', show_default=True, type=click.Path(exists=True))
+@click.option('--compact', default='models/spam_compact', show_default=True, type=click.Path(exists=True),
+              help='The same pipeline exported with src/models/compact_artifact.py.')
+@click.option('--runs', default=5, show_default=True, type=click.IntRange(min=1))
+def main(pipeline, compact, runs):
+    """ Compares the cold start (import, load, first prediction) and peak RSS of the pickled and compact artifacts.
+
+        RSS is the process's peak once the artifact is loaded, and after the first prediction, which also
+        loads NLTK for preprocessing.
+    """
+    print(f"{'format':<10}{'size KB':>10}{'import ms':>12}{'load ms':>10}{'1st pred ms':>13}{'total ms':>11}"
+          f"{'loaded RSS MB':>15}{'peak RSS MB':>13}")
+    for artifact_format, path in (('pickle', pipeline), ('compact', compact)):
+        result = cold_start(artifact_format, path, runs)
+        print(f"{artifact_format:<10}{artifact_size(path) / 1024:>10.1f}{result['import_ms']:>12.1f}"
+              f"{result['load_ms']:>10.1f}{result['first_predict_ms']:>13.1f}{result['total_ms']:>11.1f}"
+              f"{result['loaded_rss_mb']:>15.1f}{result['peak_rss_mb']:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import click
+import joblib
+import tempfile
+import numpy as np
+import scipy.sparse as sp
+from dotenv import load_dotenv, find_dotenv
+
+# Add the root directory to sys.path so that Python can find the src module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.features.feature_store import open_feature_set, save_feature_set
+from src.features.vectorizing import matrix_memory
+
+
+def timed(function, *args, **kwargs):
+    """Call `function` and return (result, elapsed seconds)."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def chunked_pass(feature_set, chunk_size):
+    """Touch every row once, chunk by chunk, as chunked evaluation does."""
+    return sum(X.sum() for X, _ in feature_set.iter_chunks(chunk_size))
+
+
+@click.command()
+@click.option('--repeat', default=1, show_default=True, help='Stack the training set N times to simulate a larger one.')
+@click.option('--chunk-size', default=10_000, show_default=True)
+def main(repeat, chunk_size):
+    """ Compares loading the training features from a pickled (X, y) tuple with opening the
+        memory-mapped feature set: time to open, to the first chunk and to a full chunked pass.
+    """
+    load_dotenv(find_dotenv())
+    X, y = open_feature_set(os.getenv('TRAIN_FILE', 'data/processed/train_features')).load()
+    X, y = sp.vstack([X] * repeat, format='csr'), np.tile(y, repeat)
+    print(f"Training features: {matrix_memory(X)}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pickle_path, store_path = os.path.join(tmp, 'train_data.pkl'), os.path.join(tmp, 'train_features')
+        _, dump_seconds = timed(joblib.dump, (X, y), pickle_path)
+        _, save_seconds = timed(save_feature_set, store_path, X, y)
+        del X, y
+
+        (X_loaded, _), pickle_seconds = timed(joblib.load, pickle_path)
+        _, pickle_pass_seconds = timed(lambda: X_loaded.sum())
+        del X_loaded
+
+        feature_set, open_seconds = timed(open_feature_set, store_path)
+        _, first_chunk_seconds = timed(next, feature_set.iter_chunks(chunk_size))
+        _, store_pass_seconds = timed(chunked_pass, feature_set, chunk_size)
+
+        print(f"\n[joblib pickle]")
+        print(f"  write           {dump_seconds:8.3f} s")
+        print(f"  load            {pickle_seconds:8.3f} s")
+        print(f"  full pass       {pickle_pass_seconds:8.3f} s")
+        print(f"\n[feature store]")
+        print(f"  write           {save_seconds:8.3f} s")
+        print(f"  open            {open_seconds:8.3f} s")
+        print(f"  first chunk     {first_chunk_seconds:8.3f} s")
+        print(f"  chunked pass    {store_pass_seconds:8.3f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import sys
+import time
+import email
+import click
+
+# Add the root directory to sys.path so that Python can find the src module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.data.html_text import HTML_EXTRACTORS
+from src.data.parse_email import parse_email_bytes
+
+
+def load_raw_emails(raw_dir, folders):
+    """Read the raw bytes of every email in the given folders of raw_dir."""
+    emails = []
+    for folder in folders:
+        folder_path = os.path.join(raw_dir, folder)
+        for filename in sorted(os.listdir(folder_path)):
+            with open(os.path.join(folder_path, filename), 'rb') as file:
+                emails.append((filename, file.read()))
+    return emails
+
+
+def top_level_type(raw_bytes):
+    """The content type of an email as a whole, e.g. text/plain, text/html or multipart/alternative."""
+    return email.message_from_string(raw_bytes.decode('utf-8', errors='ignore')).get_content_type()
+
+
+def group_by_type(emails):
+    """Group the emails by top-level content type, most common first."""
+    groups = {}
+    for filename, raw_bytes in emails:
+        groups.setdefault(top_level_type(raw_bytes), []).append((filename, raw_bytes))
+    return dict(sorted(groups.items(), key=lambda item: -len(item[1])))
+
+
+def html_parts(emails):
+    """Decode the text/html parts that parsing would clean, as the extractors receive them."""
+    parts = []
+    for _, raw_bytes in emails:
+        message = email.message_from_string(raw_bytes.decode('utf-8', errors='ignore'))
+        for part in message.walk():
+            if part.get_content_type() == 'text/html':
+                payload = part.get_payload(decode=True)
+                if payload:
+                    parts.append(payload.decode('utf-8', errors='ignore'))
+    return parts
+
+
+def normalize(text):
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def extraction_seconds(extract, parts):
+    start = time.perf_counter()
+    for part in parts:
+        extract(part)
+    return time.perf_counter() - start
+
+
+def parsing_seconds(emails, html_extractor, max_body_bytes):
+    start = time.perf_counter()
+    for filename, raw_bytes in emails:
+        parse_email_bytes(raw_bytes, filename, None, html_extractor, max_body_bytes)
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option('--raw-dir', default='data/raw', show_default=True, type=click.Path(exists=True))
+@click.option('--folder', 'folders', multiple=True, default=['easy_ham', 'hard_ham', 'spam_2'], show_default=True)
+def main(raw_dir, folders):
+    """ Compares the HTML-to-text extractors on the raw corpus: time spent on the text/html
+        parts, agreement with BeautifulSoup, and whole-email parsing throughput, overall and
+        by top-level MIME type (text/plain, text/html, multipart/alternative, ...).
+    """
+    emails = load_raw_emails(raw_dir, folders)
+    parts = html_parts(emails)
+    html_bytes = sum(len(part) for part in parts)
+    print(f"{len(emails)} emails, {len(parts)} text/html parts ({html_bytes / 2 ** 20:.1f} MB)")
+
+    reference = [normalize(HTML_EXTRACTORS['bs4'](part)) for part in parts]
+
+    print("\nExtracting the text/html parts")
+    for name, extract in HTML_EXTRACTORS.items():
+        start = time.perf_counter()
+        texts = [extract(part) for part in parts]
+        seconds = time.perf_counter() - start
+        matching = sum(normalize(text) == expected for text, expected in zip(texts, reference))
+        print(f"  {name:<7} {seconds:7.3f} s ({html_bytes / 2 ** 20 / seconds:6.1f} MB/s) | "
+              f"same text as bs4: {matching}/{len(parts)}")
+
+    print("\nParsing whole emails (text/plain parts need no extraction)")
+    for name in HTML_EXTRACTORS:
+        for max_body_bytes in (None, 512 * 1024):
+            seconds = parsing_seconds(emails, name, max_body_bytes)
+            limit = 'no limit' if max_body_bytes is None else f"{max_body_bytes // 1024} KiB cap"
+            print(f"  {name:<7} {limit:<12} {seconds:7.3f} s ({len(emails) / seconds:,.0f} emails/s)")
+
+    # Extraction ms over the group's text/html parts, then whole-email parsing (default cap) per extractor
+    print("\nBy top-level MIME type: extraction ms of the text/html parts | parsing emails/s")
+    print(f"  {'type':<26}{'emails':>7}{'html parts':>11}{'html MB':>9}"
+          + ''.join(f"{name + ' ms':>11}" for name in HTML_EXTRACTORS)
+          + ''.join(f"{name + ' /s':>11}" for name in HTML_EXTRACTORS))
+    for content_type, group in group_by_type(emails).items():
+        group_parts = html_parts(group)
+        extract_ms = [extraction_seconds(extract, group_parts) * 1000 for extract in HTML_EXTRACTORS.values()]
+        parse_rates = [len(group) / parsing_seconds(group, name, 512 * 1024) for name in HTML_EXTRACTORS]
+        print(f"  {content_type:<26}{len(group):>7}{len(group_parts):>11}"
+              f"{sum(len(part) for part in group_parts) / 2 ** 20:>9.2f}"
+              + ''.join(f"{ms:>11.1f}" for ms in extract_ms)
+              + ''.join(f"{rate:>11,.0f}" for rate in parse_rates))
+
+
+if __name__ == '__main__':
+    main()
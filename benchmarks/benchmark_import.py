@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import click
+import statistics
+import subprocess
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+
+
+def time_import(module, repeat):
+    """Import `module` in `repeat` fresh interpreters and return the wall times in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f'import {module}'], cwd=ROOT_DIR, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def slowest_imports(module, top):
+    """Return the `top` (cumulative microseconds, module) pairs reported by `python -X importtime`."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT_DIR, check=True, capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+@click.command()
+@click.option('--module', default='src.models.predict_model', show_default=True, help='Module to import.')
+@click.option('--repeat', default=10, show_default=True, help='Number of fresh interpreters to time.')
+@click.option('--top', default=10, show_default=True, help='Number of slowest imports to list.')
+def main(module, repeat, top):
+    """ Measures the cold-start import time of a module in fresh interpreters. """
+    baseline = time_import('sys', repeat)
+    timings = time_import(module, repeat)
+
+    print(f"Interpreter startup: median {statistics.median(baseline):7.1f} ms")
+    print(f"import {module}: median {statistics.median(timings):7.1f} ms | min {min(timings):7.1f} ms")
+    print(f"Slowest imports (cumulative):")
+    for cumulative, name in slowest_imports(module, top):
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
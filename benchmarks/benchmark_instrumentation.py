@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import click
+import tempfile
+
+# Add the root directory to sys.path so that Python can find the src module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src import instrumentation
+
+
+def time_spans(iterations):
+    """Return the mean cost of entering and leaving one span, in nanoseconds."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with instrumentation.span('benchmark', items=1):
+            pass
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def time_empty_loop(iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+@click.command()
+@click.option('--iterations', default=1_000_000, show_default=True)
+def main(iterations):
+    """ Measures the cost of an instrumentation span, disabled and exporting to JSON lines and Prometheus. """
+    loop = time_empty_loop(iterations)
+
+    instrumentation.configure()
+    disabled = time_spans(iterations) - loop
+
+    with tempfile.TemporaryDirectory() as tmp:
+        instrumentation.configure(jsonl_path=os.path.join(tmp, 'events.jsonl'),
+                                  prometheus_path=os.path.join(tmp, 'metrics.prom'))
+        enabled = time_spans(iterations // 10) - loop
+        instrumentation.configure()
+
+    print(f"span, disabled  {disabled:8.0f} ns")
+    print(f"span, enabled   {enabled:8.0f} ns")
+
+
+if __name__ == '__main__':
+    main()
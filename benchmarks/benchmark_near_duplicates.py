@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import click
+import random
+import logging
+import statistics
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+
+# Add the root directory to sys.path so that Python can find the src module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from suite import load_raw_corpus, percentile
+from src.data.parse_email import parse_email_bytes
+from src.features.near_duplicates import NearDuplicateIndex, near_duplicate_groups
+from src.models.predict_model import load_classifier
+from src.models.verdict_cache import NearDuplicateVerdictCache
+
+
+def index_build_and_lookup(processed_bodies, threshold):
+    """Seconds to index every body, and the per-body latencies (ms) of looking each one up in the full index."""
+    index = NearDuplicateIndex(threshold)
+    start = time.perf_counter()
+    for processed_body in processed_bodies:
+        signature = index.signature(processed_body)
+        if signature is not None:
+            index.add(signature)
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    for processed_body in processed_bodies:
+        start = time.perf_counter()
+        signature = index.signature(processed_body)
+        if signature is not None:
+            index.query(signature)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return build_seconds, sorted(latencies)
+
+
+def stream_through_cache(classifier, bodies, threshold, batch_size):
+    """Score the bodies in batches through a verdict cache; returns (hit rate, verdict agreement, seconds)."""
+    cache = NearDuplicateVerdictCache(classifier, max_entries=len(bodies), threshold=threshold)
+    predictions = []
+    start = time.perf_counter()
+    for i in range(0, len(bodies), batch_size):
+        predictions += cache.predict_batch(bodies[i:i + batch_size])
+    seconds = time.perf_counter() - start
+
+    reference = classifier.predict_batch(bodies)
+    agreement = np.mean([cached[0] == scored[0] for cached, scored in zip(predictions, reference)])
+    return cache.hits / len(bodies), agreement, seconds
+
+
+@click.command()
+@click.option('--raw-dir', default='data/raw', show_default=True, type=click.Path(exists=True))
+@click.option('--thresholds', default='0.7,0.8,0.9', show_default=True, help='Comma-separated similarity thresholds.')
+@click.option('--batch-size', default=64, show_default=True, type=click.IntRange(min=1))
+def main(raw_dir, thresholds, batch_size):
+    """ Measures the near-duplicate index on the raw corpus: build time, lookup latency, how many
+        emails are near-duplicates, and the hit rate and verdict agreement of the prediction cache.
+    """
+    load_dotenv(find_dotenv())
+    logging.getLogger().setLevel(logging.WARNING)
+    classifier = load_classifier(os.getenv('PREDICTION_PIPELINE', 'models/spam_pipeline.pkl'))
+    if isinstance(classifier, NearDuplicateVerdictCache):
+        classifier = classifier.classifier
+
+    records = [parse_email_bytes(*email) for email in load_raw_corpus(raw_dir)]
+    bodies = [record['Body'] or '' for record in records if record is not None]
+    # Inference sees emails in no particular order
+    random.Random(0).shuffle(bodies)
+    processed_bodies = classifier.preprocess(bodies)
+    print(f"{len(bodies)} emails from {raw_dir}")
+
+    print(f"\n{'threshold':<11}{'build s':>9}{'lookup p50 ms':>15}{'p95 ms':>9}{'groups':>8}{'near-dups':>11}"
+          f"{'hit rate':>10}{'agreement':>11}{'cached s':>10}{'uncached s':>12}")
+    for threshold in (float(value) for value in thresholds.split(',')):
+        build_seconds, latencies = index_build_and_lookup(processed_bodies, threshold)
+        groups = near_duplicate_groups(processed_bodies, threshold)
+        n_groups = len(np.unique(groups))
+
+        hit_rate, agreement, cached_seconds = stream_through_cache(classifier, bodies, threshold, batch_size)
+        start = time.perf_counter()
+        for i in range(0, len(bodies), batch_size):
+            classifier.predict_batch(bodies[i:i + batch_size])
+        uncached_seconds = time.perf_counter() - start
+
+        print(f"{threshold:<11}{build_seconds:>9.3f}{statistics.median(latencies):>15.3f}"
+              f"{percentile(latencies, 0.95):>9.3f}{n_groups:>8}{len(bodies) - n_groups:>11}{hit_rate:>10.1%}"
+              f"{agreement:>11.2%}{cached_seconds:>10.2f}{uncached_seconds:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import click
+import joblib
+import statistics
+from dotenv import load_dotenv, find_dotenv
+
+# Add the root directory to sys.path so that Python can find the src module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.models.predict_model import get_classifier, clear_classifiers, predict_batch
+
+
+def load_example_emails(*file_paths):
+    """Load the example email bodies used as benchmark inputs."""
+    emails = []
+    for file_path in file_paths:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            emails.extend(f.read().strip().split("\n\n"))
+    return emails
+
+
+def predict_cold(email_body, pipeline_filepath):
+    """Load the artifact on every single prediction, as predict_email_class used to."""
+    return joblib.load(pipeline_filepath).predict(email_body)
+
+
+def predict_warm(email_body, pipeline_filepath):
+    """The registry-backed path: the artifact stays loaded between calls."""
+    return get_classifier(pipeline_filepath).predict(email_body)
+
+
+def time_calls(predict, emails, pipeline_filepath, iterations):
+    """Time `iterations` predictions and return the per-call latencies in milliseconds."""
+    latencies = []
+    for i in range(iterations):
+        email_body = emails[i % len(emails)]
+        start = time.perf_counter()
+        predict(email_body, pipeline_filepath)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<12} mean {statistics.mean(latencies):8.3f} ms | "
+          f"p50 {statistics.median(latencies):8.3f} ms | p99 {p99:8.3f} ms")
+
+
+def time_throughput(emails, pipeline_filepath, batch_size):
+    """Score `batch_size` emails one at a time and as one batch, returning emails per second for each."""
+    bodies = [emails[i % len(emails)] for i in range(batch_size)]
+    classifier = get_classifier(pipeline_filepath)
+
+    start = time.perf_counter()
+    for email_body in bodies:
+        classifier.predict(email_body)
+    single = batch_size / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    predict_batch(bodies, pipeline_filepath)
+    batched = batch_size / (time.perf_counter() - start)
+    return single, batched
+
+
+@click.command()
+@click.option('--iterations', default=200, show_default=True, help='Number of predictions per mode.')
+@click.option('--batch-size', default=5000, show_default=True, help='Number of emails scored in the throughput run.')
+def main(iterations, batch_size):
+    """ Compares single-email latency of per-call artifact loading against the warm classifier,
+        and one-at-a-time scoring against predict_batch.
+    """
+    load_dotenv(find_dotenv())
+    pipeline_filepath = os.getenv('PREDICTION_PIPELINE', 'models/spam_pipeline.pkl')
+
+    emails = load_example_emails('data/example-emails/spam_emails.txt', 'data/example-emails/ham_emails.txt')
+
+    cold = time_calls(predict_cold, emails, pipeline_filepath, iterations)
+
+    # Warm the registry once so the timed calls measure scoring only
+    clear_classifiers()
+    get_classifier(pipeline_filepath)
+    warm = time_calls(predict_warm, emails, pipeline_filepath, iterations)
+
+    report('per-call', cold)
+    report('warm', warm)
+    print(f"Speedup: {statistics.mean(cold) / statistics.mean(warm):.1f}x")
+
+    single, batched = time_throughput(emails, pipeline_filepath, batch_size)
+    print(f"Throughput over {batch_size} emails: one-at-a-time {single:,.0f}/s | batched {batched:,.0f}/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import click
+import pandas as pd
+from dotenv import load_dotenv, find_dotenv
+
+# Add the root directory to sys.path so that Python can find the src module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.features.preprocessing import (
+    Preprocessor, preprocess_email_body, preprocess_email_body_nltk, preprocess_many
+)
+
+
+def check_parity(bodies):
+    """Return the indices of bodies where the engine's output differs from the NLTK reference."""
+    return [i for i, body in enumerate(bodies) if preprocess_email_body(body) != preprocess_email_body_nltk(body)]
+
+
+def throughput(preprocess, bodies):
+    """Return emails per second for preprocessing every body."""
+    start = time.perf_counter()
+    preprocess(bodies)
+    return len(bodies) / (time.perf_counter() - start)
+
+
+@click.command()
+@click.option('--workers', default=os.cpu_count(), show_default=True, help='Processes used by preprocess_many.')
+@click.option('--limit', default=0, help='Only use the first N emails (0 for all).')
+def main(workers, limit):
+    """ Checks that the preprocessing engine matches the NLTK reference on the parsed corpus,
+        then compares their throughput.
+    """
+    load_dotenv(find_dotenv())
+    input_filepath = os.getenv('INPUT_FILE', 'data/interim/parsed_emails.csv')
+    bodies = pd.read_csv(input_filepath)['Body'].fillna('').tolist()
+    if limit:
+        bodies = bodies[:limit]
+
+    mismatches = check_parity(bodies)
+    print(f"Parity: {len(bodies) - len(mismatches)}/{len(bodies)} bodies identical to the NLTK reference")
+
+    reference = throughput(lambda b: [preprocess_email_body_nltk(body) for body in b], bodies)
+    # A fresh engine so the first pass starts from an empty lemma cache
+    engine = Preprocessor()
+    cold = throughput(lambda b: [engine(body) for body in b], bodies)
+    warm = throughput(lambda b: [engine(body) for body in b], bodies)
+    parallel = throughput(lambda b: preprocess_many(b, workers=workers), bodies)
+
+    print(f"NLTK reference       {reference:10,.0f} emails/s")
+    print(f"engine (cold cache)  {cold:10,.0f} emails/s")
+    print(f"engine (warm cache)  {warm:10,.0f} emails/s")
+    print(f"preprocess_many x{workers:<3} {parallel:10,.0f} emails/s")
+    print(f"Lemma cache: {engine.cache_info()}")
+
+    if mismatches:
+        print(f"First mismatching rows: {mismatches[:10]}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import click
+import pickle
+import pandas as pd
+from dotenv import load_dotenv, find_dotenv
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.model_selection import train_test_split
+
+# Add the root directory to sys.path so that Python can find the src module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.features.preprocessing import preprocess_many
+from src.features.vectorizing import FEATURE_BACKENDS, build_vectorizer, matrix_memory
+
+
+def timed(function, *args, **kwargs):
+    """Call `function` and return (result, elapsed seconds)."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+@click.command()
+@click.option('--jobs', default=os.cpu_count(), show_default=True, help='Parallel jobs for the hashing transform.')
+@click.option('--repeat', default=1, show_default=True, help='Replicate the corpus N times to simulate a larger one.')
+def main(jobs, repeat):
+    """ Compares the fitted-vocabulary TF-IDF backend with the hashing backend on the parsed corpus:
+        fit and transform time, artifact size, feature memory and Naive Bayes accuracy.
+    """
+    load_dotenv(find_dotenv())
+    input_filepath = os.getenv('INPUT_FILE', 'data/interim/parsed_emails.csv')
+    df = pd.read_csv(input_filepath)
+    bodies = preprocess_many(df['Body'].fillna('').tolist()) * repeat
+    labels = df['Label'].tolist() * repeat
+
+    train_bodies, test_bodies, y_train, y_test = train_test_split(bodies, labels, test_size=0.3, random_state=42)
+    print(f"{len(train_bodies)} training and {len(test_bodies)} testing emails")
+
+    for backend in FEATURE_BACKENDS:
+        vectorizer = build_vectorizer(backend)
+        X_train, fit_seconds = timed(vectorizer.fit_transform, train_bodies)
+        X_test, transform_seconds = timed(vectorizer.transform, test_bodies)
+        artifact_bytes = len(pickle.dumps(vectorizer, protocol=pickle.HIGHEST_PROTOCOL))
+
+        accuracy = MultinomialNB().fit(X_train, y_train).score(X_test, y_test)
+
+        print(f"\n[{backend}]")
+        print(f"  fit_transform   {fit_seconds:8.3f} s")
+        print(f"  transform       {transform_seconds:8.3f} s ({len(test_bodies) / transform_seconds:,.0f} emails/s)")
+        if backend == 'hashing':
+            vectorizer.transform(test_bodies[:2 * vectorizer.chunk_size], n_jobs=jobs)  # Start the worker pool
+            _, parallel_seconds = timed(vectorizer.transform, test_bodies, n_jobs=jobs)
+            print(f"  transform x{jobs:<3}  {parallel_seconds:8.3f} s ({len(test_bodies) / parallel_seconds:,.0f} emails/s)")
+        print(f"  artifact        {artifact_bytes / 1024:8.1f} KB")
+        print(f"  train features  {matrix_memory(X_train)}")
+        print(f"  NB accuracy     {accuracy:8.4f}")
+
+
+if __name__ == '__main__':
+    main()
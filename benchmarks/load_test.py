@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import time
+import json
+import click
+import random
+import asyncio
+import statistics
+
+
+def load_example_emails(*file_paths):
+    """Load the example email bodies sent as requests."""
+    emails = []
+    for file_path in file_paths:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            emails.extend(f.read().strip().split("\n\n"))
+    return emails
+
+
+async def send_predict(reader, writer, host, email_body):
+    """Send one POST /predict on an open keep-alive connection and return the response status."""
+    content = json.dumps({'body': email_body}).encode('utf-8')
+    writer.write((f"POST /predict HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(content)}\r\n\r\n").encode('latin-1') + content)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(host, port, emails, deadline, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status = await send_predict(reader, writer, host, random.choice(emails))
+            # Rejections and errors return without scoring, so only successes are timed
+            if status == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run(host, port, concurrency, duration, emails):
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, emails, deadline, latencies, statuses) for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8000, show_default=True, type=int)
+@click.option('--concurrency', default=32, show_default=True, help='Number of concurrent keep-alive connections.')
+@click.option('--duration', default=10.0, show_default=True, help='Seconds to generate load for.')
+@click.option('--max-rejection-rate', default=0.01, show_default=True, type=click.FloatRange(0, 1),
+              help='Fail when a larger fraction of requests is rejected with 503 (overloaded).')
+def main(host, port, concurrency, duration, max_rejection_rate):
+    """ Generates load against src/models/serve_model.py and reports latency percentiles and throughput.
+
+        Latency and throughput count scored (200) requests only; 503 rejections are reported separately.
+    """
+    emails = load_example_emails('data/example-emails/spam_emails.txt', 'data/example-emails/ham_emails.txt')
+    latencies, statuses, elapsed = asyncio.run(run(host, port, concurrency, duration, emails))
+    total = sum(statuses.values())
+    if not total:
+        raise click.ClickException("No request completed")
+
+    rejected = statuses.get(503, 0)
+    latencies.sort()
+    print(f"{len(latencies)} requests scored in {elapsed:.1f} s with {concurrency} connections: "
+          f"{len(latencies) / elapsed:,.0f} requests/s")
+    if latencies:
+        print(f"Latency: p50 {percentile(latencies, 0.50):.2f} ms | p99 {percentile(latencies, 0.99):.2f} ms | "
+              f"mean {statistics.mean(latencies):.2f} ms | max {latencies[-1]:.2f} ms")
+    print(f"Rejected (503): {rejected} of {total} requests ({rejected / total:.1%})")
+    print(f"Status codes: {dict(sorted(statuses.items()))}")
+    if rejected / total > max_rejection_rate:
+        raise click.ClickException(f"{rejected / total:.1%} of requests were rejected, above "
+                                   f"--max-rejection-rate {max_rejection_rate:.1%}; the server is overloaded, "
+                                   f"so the latencies above are not those of a sustainable load")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import click
+import logging
+import platform
+import tempfile
+import statistics
+import tracemalloc
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Add the root directory to sys.path so that Python can find the src module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_corpus import generate_corpus
+from src.data.make_dataset import LABELLED_FOLDERS
+from src.data.parse_email import parse_email_bytes
+from src.features.preprocessing import Preprocessor
+from src.features.vectorizing import FEATURE_BACKENDS, build_vectorizer, vectorize_text
+from src.features.train_test_split import train_data_split
+from src.features.over_sampling import REBALANCE_STRATEGIES, rebalance
+from src.features.feature_store import InMemoryFeatureSet
+from src.models.train_model import train_naive_bayes
+from src.models.pipeline import SpamClassifier
+
+# Lower is better for these metrics, higher is better for throughput
+LOWER_IS_BETTER = ('p50_ms', 'p95_ms', 'p99_ms', 'peak_traced_mb')
+# Latency changes smaller than this are timer noise, whatever their relative size
+MIN_LATENCY_CHANGE_MS = 0.05
+# Likewise for traced memory, where small stages allocate a fraction of a MB
+MIN_MEMORY_CHANGE_MB = 1.0
+
+
+def peak_rss_mb():
+    """High-water mark of this process's resident memory over its whole life, in MB (None where unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def traced_peak_mb(function, calls):
+    """Peak memory allocated while making the calls under tracemalloc, in MB.
+
+    Only allocations made during the calls are traced, so unlike the process's peak RSS this
+    belongs to the stage alone. Tracing slows allocations down, so it is kept apart from timing.
+    """
+    tracemalloc.start()
+    try:
+        for args in calls:
+            function(*args)
+        return round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def measure(function, calls, items=None, memory_calls=None):
+    """Time each of `calls` (a list of argument tuples) and summarize them as a stage result.
+
+    `items` is the number of items all calls processed together (one per call by default).
+    The stage's peak memory is then traced over `memory_calls` (`calls` by default, none if empty).
+    Returns (stage result, last return value); latencies are per call, throughput is in items per second.
+    """
+    items = len(calls) if items is None else items
+    latencies, result = [], None
+    for args in calls:
+        start = time.perf_counter()
+        result = function(*args)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    total_seconds = sum(latencies) / 1000
+    latencies.sort()
+    stage = {
+        'calls': len(latencies),
+        'items': items,
+        'seconds': round(total_seconds, 4),
+        'throughput': round(items / total_seconds, 1) if total_seconds else None,
+        'p50_ms': round(statistics.median(latencies), 4),
+        'p95_ms': round(percentile(latencies, 0.95), 4),
+        'p99_ms': round(percentile(latencies, 0.99), 4),
+        'peak_traced_mb': None,
+    }
+    memory_calls = calls if memory_calls is None else memory_calls
+    if memory_calls:
+        stage['peak_traced_mb'] = traced_peak_mb(function, memory_calls)
+    return stage, result
+
+
+def load_raw_corpus(raw_dir):
+    """Read the raw bytes and labels of every email in the labelled folders of raw_dir."""
+    emails = []
+    for folder, label in LABELLED_FOLDERS:
+        folder_path = os.path.join(raw_dir, folder)
+        for filename in sorted(os.listdir(folder_path)):
+            with open(os.path.join(folder_path, filename), 'rb') as f:
+                emails.append((f.read(), filename, label))
+    return emails
+
+
+def run_suite(emails, feature_backend='tfidf', rebalance_strategy='smote', batch_size=64, repeat=3,
+              inference_emails=1000, trace_memory=True):
+    """Run every pipeline stage on the corpus and return the results keyed by stage name.
+
+    With `trace_memory`, each stage is run once more under tracemalloc for its peak memory.
+    """
+    stages = {}
+    # The whole-corpus stages repeat one identical call, so one traced call gives their peak
+    once = [()] if trace_memory else []
+    every = None if trace_memory else []
+
+    stages['parse'], _ = measure(parse_email_bytes, emails, memory_calls=every)
+    records = [parse_email_bytes(*email) for email in emails]
+    records = [record for record in records if record is not None]
+    bodies, labels = [record['Body'] or '' for record in records], [record['Label'] for record in records]
+
+    # A fresh preprocessor, so that its lemma memo starts as cold as in a new training run
+    preprocessor = Preprocessor()
+    stages['preprocess'], _ = measure(preprocessor, [(body,) for body in bodies], memory_calls=[])
+    if trace_memory:
+        # Traced with another fresh preprocessor, so that its memo grows as in the timed run
+        stages['preprocess']['peak_traced_mb'] = traced_peak_mb(Preprocessor(), [(body,) for body in bodies])
+    processed_bodies = [preprocessor(body) for body in bodies]
+
+    stages['vectorize'], (X, y, vectorizer) = measure(
+        lambda: vectorize_text(processed_bodies, labels, build_vectorizer(feature_backend)), [()] * repeat,
+        repeat * len(processed_bodies), once)
+    X_train, X_test, y_train, y_test = train_data_split(X, y)
+    test_set = InMemoryFeatureSet(X_test, y_test)
+
+    stages['rebalance'], (X_balanced, y_balanced, sample_weight) = measure(
+        lambda: rebalance(X_train, y_train, rebalance_strategy), [()] * repeat, repeat * X_train.shape[0],
+        once)
+
+    stages['train'], (model, accuracy) = measure(
+        lambda: train_naive_bayes(X_balanced, y_balanced, test_set, sample_weight), [()] * repeat,
+        repeat * X_balanced.shape[0], once)
+    stages['train']['accuracy'] = round(accuracy, 4)
+
+    classifier = SpamClassifier(preprocessor, vectorizer, model)
+    inference_bodies = (bodies * (inference_emails // max(1, len(bodies)) + 1))[:inference_emails]
+    stages['predict_single'], _ = measure(classifier.predict, [(body,) for body in inference_bodies],
+                                          memory_calls=every)
+    batches = [(inference_bodies[i:i + batch_size],) for i in range(0, len(inference_bodies), batch_size)]
+    stages['predict_batch'], _ = measure(classifier.predict_batch, batches, len(inference_bodies), every)
+    return stages
+
+
+def compare_results(results, baseline, threshold):
+    """Return (stage, metric, baseline value, value, change) for every metric that regressed past `threshold`."""
+    regressions = []
+    for stage, metrics in baseline['stages'].items():
+        current = results['stages'].get(stage)
+        if current is None:
+            continue
+        for metric in ('throughput', *LOWER_IS_BETTER):
+            before, after = metrics.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            if metric.endswith('_ms') and abs(after - before) < MIN_LATENCY_CHANGE_MS:
+                continue
+            if metric.endswith('_mb') and abs(after - before) < MIN_MEMORY_CHANGE_MB:
+                continue
+            change = (after - before) / before
+            worse = change > threshold if metric in LOWER_IS_BETTER else -change > threshold
+            if worse:
+                regressions.append((stage, metric, before, after, change))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'stage':<16}{'items':>8}{'items/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+    for stage, metrics in results['stages'].items():
+        print(f"{stage:<16}{metrics['items']:>8}{metrics['throughput'] or 0:>12,.1f}{metrics['p50_ms']:>10.3f}"
+              f"{metrics['p95_ms']:>10.3f}{metrics['p99_ms']:>10.3f}{metrics.get('peak_traced_mb') or 0:>10.1f}")
+    process_peak = results['metadata'].get('process_peak_rss_mb')
+    if process_peak is not None:
+        print(f"Process peak RSS over all stages: {process_peak:.1f} MB")
+
+
+def print_regressions(regressions, threshold):
+    if not regressions:
+        print(f"\nNo stage regressed by more than {threshold:.0%}")
+        return
+    print(f"\n{len(regressions)} regression(s) past {threshold:.0%}:")
+    for stage, metric, before, after, change in regressions:
+        print(f"  {stage:<16}{metric:<13}{before:>12,.3f} -> {after:>12,.3f} ({change:+.1%})")
+
+
+@click.group()
+def cli():
+    """ End-to-end benchmark suite of the pipeline stages. """
+
+
+@cli.command()
+@click.option('--raw-dir', default='data/raw', show_default=True, type=click.Path(),
+              help='Raw corpus laid out like data/raw; ignored with --synthetic.')
+@click.option('--synthetic', default=0, show_default=True, type=click.IntRange(min=0),
+              help='Benchmark on a generated corpus of this many emails instead of --raw-dir.')
+@click.option('--feature-backend', default='tfidf', show_default=True, type=click.Choice(FEATURE_BACKENDS))
+@click.option('--rebalance-strategy', default='smote', show_default=True, type=click.Choice(REBALANCE_STRATEGIES))
+@click.option('--batch-size', default=64, show_default=True, type=click.IntRange(min=1))
+@click.option('--repeat', default=3, show_default=True, type=click.IntRange(min=1),
+              help='Runs of the whole-corpus stages (vectorize, rebalance, train).')
+@click.option('--output', type=click.Path(), help='Write the results as JSON to this file.')
+@click.option('--baseline', type=click.Path(exists=True), help='Compare against these results and fail on regressions.')
+@click.option('--threshold', default=0.2, show_default=True, help='Relative change counted as a regression.')
+@click.option('--no-memory', is_flag=True, help='Skip the extra traced run of each stage that measures its peak memory.')
+def run(raw_dir, synthetic, feature_backend, rebalance_strategy, batch_size, repeat, output, baseline, threshold,
+        no_memory):
+    """ Runs every stage and reports throughput, latency percentiles and peak memory. """
+    # Per-call log lines from the stages would be measured too
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if synthetic:
+        with tempfile.TemporaryDirectory() as corpus_dir:
+            generate_corpus(corpus_dir, synthetic)
+            emails = load_raw_corpus(corpus_dir)
+        corpus = f"synthetic:{synthetic}"
+    else:
+        emails = load_raw_corpus(raw_dir)
+        corpus = raw_dir
+
+    stages = run_suite(emails, feature_backend, rebalance_strategy, batch_size, repeat, trace_memory=not no_memory)
+    results = {
+        'metadata': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'corpus': corpus,
+            'emails': len(emails),
+            'feature_backend': feature_backend,
+            'rebalance_strategy': rebalance_strategy,
+            'batch_size': batch_size,
+            # Cumulative over every stage, so it is reported but not compared per stage
+            'process_peak_rss_mb': peak_rss_mb(),
+        },
+        'stages': stages,
+    }
+    print_results(results)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {output}")
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare_results(results, json.load(f), threshold)
+        print_regressions(regressions, threshold)
+        if regressions:
+            sys.exit(1)
+
+
+@cli.command()
+@click.argument('results_file', type=click.Path(exists=True))
+@click.argument('baseline_file', type=click.Path(exists=True))
+@click.option('--threshold', default=0.2, show_default=True, help='Relative change counted as a regression.')
+def compare(results_file, baseline_file, threshold):
+    """ Compares saved results against a baseline; exits with status 1 if any stage regressed. """
+    with open(results_file) as f:
+        results = json.load(f)
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+
+    print_results(results)
+    regressions = compare_results(results, baseline, threshold)
+    print_regressions(regressions, threshold)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import sys
+import click
+import random
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+# Add the root directory to sys.path so that Python can find the src module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.data.make_dataset import LABELLED_FOLDERS
+
+FILLER_WORDS = ('the of and to in is you that it for on are with as this be at have from or by not we your '
+                'will can all about more if which their has would there what time when so up out them into '
+                'some other than then now only its also after any new like over these could people').split()
+
+
+def load_words(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return sorted(set(re.findall(r"[A-Za-z']{3,}", f.read().lower())))
+
+
+def make_body(rng, topic_words, min_words, max_words):
+    """Sentences mixing filler words with words of the email's class, so there is something to learn."""
+    words = [rng.choice(topic_words) if rng.random() < 0.3 else rng.choice(FILLER_WORDS)
+             for _ in range(rng.randint(min_words, max_words))]
+    sentences = [' '.join(words[i:i + 12]).capitalize() + '.' for i in range(0, len(words), 12)]
+    paragraphs = [' '.join(sentences[i:i + 4]) for i in range(0, len(sentences), 4)]
+    return paragraphs
+
+
+def make_email(rng, index, topic_words, html_fraction, min_words, max_words):
+    """Build one RFC 822 email: plain text, HTML only, or multipart with both."""
+    paragraphs = make_body(rng, topic_words, min_words, max_words)
+    message = EmailMessage()
+    message['From'] = f"sender{rng.randint(1, 5000)}@example.com"
+    message['To'] = f"user{rng.randint(1, 500)}@example.org"
+    message['Subject'] = ' '.join(rng.choice(topic_words) for _ in range(rng.randint(3, 8))).capitalize()
+    message['Date'] = formatdate(1_000_000_000 + index * 60)
+    message['Message-ID'] = make_msgid(idstring=str(index), domain='example.com')
+
+    text = '\n\n'.join(paragraphs)
+    html = ('<html><head><style>p {margin: 0}</style></head><body>'
+            + ''.join(f"<p>{paragraph} <a href=\"http://example.com/{index}\">link</a></p>" for paragraph in paragraphs)
+            + '</body></html>')
+    kind = rng.random()
+    if kind < html_fraction / 2:
+        message.set_content(html, subtype='html')
+    elif kind < html_fraction:
+        message.set_content(text)
+        message.add_alternative(html, subtype='html')
+    else:
+        message.set_content(text)
+    return message.as_bytes()
+
+
+def generate_corpus(output_directory, n_emails, spam_fraction=0.3, html_fraction=0.3, min_words=40, max_words=400,
+                    seed=0):
+    """Write `n_emails` synthetic emails into the labelled folders make_dataset reads (easy_ham, hard_ham, spam_2)."""
+    rng = random.Random(seed)
+    example_dir = 'data/example-emails'
+    topic_words = {0: load_words(os.path.join(example_dir, 'ham_emails.txt')),
+                   1: load_words(os.path.join(example_dir, 'spam_emails.txt'))}
+
+    folders = {folder: label for folder, label in LABELLED_FOLDERS}
+    ham_folders = [folder for folder, label in folders.items() if label == 0]
+    spam_folders = [folder for folder, label in folders.items() if label == 1]
+    for folder in folders:
+        os.makedirs(os.path.join(output_directory, folder), exist_ok=True)
+
+    for index in range(n_emails):
+        label = int(rng.random() < spam_fraction)
+        folder = rng.choice(spam_folders if label else ham_folders)
+        raw_bytes = make_email(rng, index, topic_words[label], html_fraction, min_words, max_words)
+        with open(os.path.join(output_directory, folder, f"{index:08d}.synthetic"), 'wb') as f:
+            f.write(raw_bytes)
+
+
+@click.command()
+@click.argument('output_directory', type=click.Path())
+@click.option('--emails', default=10_000, show_default=True, type=click.IntRange(min=1))
+@click.option('--spam-fraction', default=0.3, show_default=True, type=click.FloatRange(0, 1))
+@click.option('--html-fraction', default=0.3, show_default=True, type=click.FloatRange(0, 1),
+              help='Fraction of emails with an HTML part (half of them HTML only).')
+@click.option('--seed', default=0, show_default=True)
+def main(output_directory, emails, spam_fraction, html_fraction, seed):
+    """ Generates a synthetic raw corpus laid out like data/raw, at any scale, for the benchmarks. """
+    generate_corpus(output_directory, emails, spam_fraction, html_fraction, seed=seed)
+    print(f"Wrote {emails} emails to {output_directory}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,17 @@
 import os
 import subprocess
 
+from src.features.preprocessing import verify_nltk_resources
+
 # Define the file paths
 model_file_path = 'models/spam_classifier_model.pkl'
 vectorizer_file_path = 'models/tfidf_vectorizer.pkl'
-train_data_file_path = 'data/processed/train_data.pkl'
-test_data_file_path = 'data/processed/test_data.pkl'
+pipeline_file_path = 'models/spam_pipeline.pkl'
+train_data_file_path = 'data/processed/train_features'
+test_data_file_path = 'data/processed/test_features'
 train_model_script = 'src/models/train_model.py'
 build_features_script = 'src/features/build_features.py'
+provision_nltk_script = 'src/features/preprocessing.py'
 
 def check_file_exists(file_path):
     """Check if a file exists at the specified path."""
@@ -15,6 +19,16 @@ def check_file_exists(file_path):
     print(f"Checking if {file_path} exists: {exists}")
     return exists
 
+def check_nltk_resources():
+    """Check if the NLTK data used by preprocessing is installed locally."""
+    try:
+        verify_nltk_resources()
+        exists = True
+    except LookupError:
+        exists = False
+    print(f"Checking if NLTK data is installed: {exists}")
+    return exists
+
 def run_script(script_path):
     """Run a Python script using subprocess."""
     try:
@@ -27,12 +41,18 @@ def run_script(script_path):
 if __name__ == "__main__":
     print("Starting setup...")
 
-    # Step 1: Check if model and vectorizer files exist
+    # Step 0: Download the NLTK data once, so that later runs work offline
+    if not check_nltk_resources():
+        print("NLTK data not found. Downloading it...")
+        run_script(provision_nltk_script)
+
+    # Step 1: Check if model, vectorizer and pipeline files exist
     model_exists = check_file_exists(model_file_path)
     vectorizer_exists = check_file_exists(vectorizer_file_path)
+    pipeline_exists = check_file_exists(pipeline_file_path)
 
-    if model_exists and vectorizer_exists:
-        print("Model and vectorizer already exist. No need to retrain.")
+    if model_exists and vectorizer_exists and pipeline_exists:
+        print("Model, vectorizer and pipeline already exist. No need to retrain.")
     else:
         # Step 2: Check if train and test data files exist
         train_data_exists = check_file_exists(train_data_file_path)
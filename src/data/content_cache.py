@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+
+def content_hash(content):
+    """Return the SHA-256 hex digest of bytes or text (text is hashed as UTF-8)."""
+    if isinstance(content, str):
+        content = content.encode('utf-8', errors='surrogatepass')
+    return hashlib.sha256(content).hexdigest()
+
+
+def source_version(*file_paths):
+    """Return a version string derived from the source of the given files.
+
+    Any edit to the code producing the cached values changes the version, which in turn
+    invalidates the cache without anyone having to remember to bump a constant.
+    """
+    digest = hashlib.sha256()
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+class ContentCache:
+    """On-disk key/value cache for one pipeline stage, keyed by content hash.
+
+    Several stages can share one SQLite file; each stage gets its own table. When the
+    stage's version differs from the one the table was built with, the table is emptied.
+    """
+
+    # SQLite limits the number of bound parameters per statement
+    _MAX_PARAMS = 500
+
+    key = staticmethod(content_hash)
+
+    def __init__(self, path, name, version):
+        if not name.isidentifier():
+            raise ValueError(f"Invalid cache name: {name!r}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.name = name
+        self.version = version
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS cache_versions (name TEXT PRIMARY KEY, version TEXT)")
+        self._connection.execute(f"CREATE TABLE IF NOT EXISTS {name} (key TEXT PRIMARY KEY, value TEXT)")
+
+        row = self._connection.execute("SELECT version FROM cache_versions WHERE name = ?", (name,)).fetchone()
+        if row is None or row[0] != version:
+            self._connection.execute(f"DELETE FROM {name}")
+            self._connection.execute("INSERT OR REPLACE INTO cache_versions VALUES (?, ?)", (name, version))
+        self._connection.commit()
+
+    def get_many(self, keys):
+        """Return a dict of the cached values for whichever of `keys` are present."""
+        keys = list(keys)
+        found = {}
+        for start in range(0, len(keys), self._MAX_PARAMS):
+            batch = keys[start:start + self._MAX_PARAMS]
+            placeholders = ','.join('?' * len(batch))
+            rows = self._connection.execute(
+                f"SELECT key, value FROM {self.name} WHERE key IN ({placeholders})", batch)
+            found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def put_many(self, items):
+        """Store (key, value) pairs; values must be JSON-serializable."""
+        self._connection.executemany(
+            f"INSERT OR REPLACE INTO {self.name} VALUES (?, ?)",
+            ((key, json.dumps(value)) for key, value in items))
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
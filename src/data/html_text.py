@@ -0,0 +1,100 @@
+import re
+import html
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+
+# Elements whose content is code rather than text; BeautifulSoup's get_text leaves them out too
+NON_TEXT_TAGS = {'script', 'style', 'template'}
+
+
+class _TextCollector(HTMLParser):
+    """Collects the text of an HTML document as the stdlib tokenizer streams through it."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+        self._in_text = False
+
+    def handle_starttag(self, tag, attrs):
+        self._in_text = False
+        if tag in NON_TEXT_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        self._in_text = False
+        if tag in NON_TEXT_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        # The tokenizer may split one run of text (e.g. around a stray '<'); like
+        # BeautifulSoup, treat consecutive data as a single string
+        if self._in_text:
+            self.parts[-1] += data
+        else:
+            self.parts.append(data)
+            self._in_text = True
+
+    def handle_comment(self, data):
+        self._in_text = False
+
+    def handle_decl(self, decl):
+        self._in_text = False
+
+    def handle_pi(self, data):
+        self._in_text = False
+
+    def unknown_decl(self, data):
+        self._in_text = False
+        # <![CDATA[...]]> sections are text as far as BeautifulSoup is concerned
+        if data.startswith('CDATA[') and not self._skip_depth:
+            self.parts.append(data[len('CDATA['):])
+
+
+def extract_text_stdlib(html_content):
+    """Extract text with the stdlib HTML tokenizer, without building a tree."""
+    collector = _TextCollector()
+    try:
+        collector.feed(html_content)
+        collector.close()
+    except Exception:
+        # Badly broken markup: keep whatever text was collected so far
+        pass
+    return ' '.join(collector.parts)
+
+
+_SCRIPT_STYLE_RE = re.compile(r'<(script|style|template)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_TAG_RE = re.compile(r'<[^>]*>')
+
+
+def extract_text_regex(html_content):
+    """Extract text by stripping tags with regular expressions; the fastest, but least faithful."""
+    text = _SCRIPT_STYLE_RE.sub(' ', html_content)
+    text = _COMMENT_RE.sub(' ', text)
+    text = _TAG_RE.sub(' ', text)
+    return html.unescape(text)
+
+
+def extract_text_bs4(html_content):
+    """Extract text from a full BeautifulSoup tree; the reference, and the slowest."""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    return soup.get_text(separator=' ')
+
+
+HTML_EXTRACTORS = {
+    'stdlib': extract_text_stdlib,
+    'regex': extract_text_regex,
+    'bs4': extract_text_bs4,
+}
+DEFAULT_HTML_EXTRACTOR = 'stdlib'
+
+
+def get_html_extractor(name):
+    """Return the HTML-to-text function registered under `name`."""
+    try:
+        return HTML_EXTRACTORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown HTML extractor '{name}', expected one of {sorted(HTML_EXTRACTORS)}")
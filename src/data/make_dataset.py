@@ -3,65 +3,107 @@ import click
 import logging
 import os
 import csv
+import sys
+from dotenv import load_dotenv, find_dotenv
+from concurrent.futures import ProcessPoolExecutor
 
-from parse_email import read_emails_from_folder
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.data.parse_email import CSV_HEADERS, DEFAULT_MAX_BODY_BYTES, cache_version, iter_email_records
+from src.data.html_text import DEFAULT_HTML_EXTRACTOR, HTML_EXTRACTORS
+from src.data.content_cache import ContentCache
+from src import instrumentation
+
+# Folders of the raw corpus, with the label of the emails they hold
+LABELLED_FOLDERS = [('easy_ham', 0), ('hard_ham', 0), ('spam_2', 1)]
 
 
 @click.command()
 @click.argument('input_directory', default = 'data/raw', type=click.Path(exists=True))
 @click.argument('output_directory', default = 'data/interim', type=click.Path())
-def main(input_directory, output_directory):
+@click.option('--workers', default=1, show_default=True, type=click.IntRange(min=1),
+              help='Number of processes parsing emails in parallel.')
+@click.option('--chunk-size', default=500, show_default=True, type=click.IntRange(min=1),
+              help='Number of emails parsed and written per chunk; bounds peak memory.')
+# Read when the command runs, after .env is loaded; like the other scripts, an empty CACHE_FILE disables the cache
+@click.option('--cache-file', default=lambda: os.getenv('CACHE_FILE', 'data/interim/email_cache.sqlite'),
+              show_default='$CACHE_FILE or data/interim/email_cache.sqlite', type=click.Path(),
+              help='Content-hash cache of parsed emails, so unchanged files are not parsed again (empty to disable).')
+@click.option('--no-cache', is_flag=True, help='Parse every email, ignoring and not updating the cache.')
+@click.option('--html-extractor', default=DEFAULT_HTML_EXTRACTOR, show_default=True,
+              type=click.Choice(sorted(HTML_EXTRACTORS)), help='How text is extracted from HTML bodies.')
+@click.option('--max-body-bytes', default=DEFAULT_MAX_BODY_BYTES, show_default=True, type=click.IntRange(min=0),
+              help='Truncate each body to this many bytes before cleaning (0 for no limit).')
+def main(input_directory, output_directory, workers, chunk_size, cache_file, no_cache, html_extractor, max_body_bytes):
     """ Runs data processing scripts to turn raw data from (../raw) into
         cleaned data ready to be analyzed (saved in ../processed).
     """
     logger = logging.getLogger(__name__)
     logger.info(f'Loading raw data from {input_directory}')
 
-    # Paths for different email categories
-    easy_ham_path = os.path.join(input_directory, 'easy_ham')
-    hard_ham_path = os.path.join(input_directory, 'hard_ham')
-    spam_path = os.path.join(input_directory, 'spam_2')
-
-    logger.info(f"Parsing & Labeling the data from {easy_ham_path}, {hard_ham_path}, {spam_path}")
-
-    # Read and label emails
-    easy_ham_parsed_emails = read_emails_from_folder(easy_ham_path, label=0)
-    hard_ham_parsed_emails = read_emails_from_folder(hard_ham_path, label=0)
-    spam_parsed_emails = read_emails_from_folder(spam_path, label=1)
+    # Paths for different email categories, with their labels
+    folders = [(os.path.join(input_directory, folder), label) for folder, label in LABELLED_FOLDERS]
 
-    logger.info(f"Creating and saving csv file in '{output_directory}' for parsed emails")
-
-    # Combine all parsed emails
-    parsed_emails = easy_ham_parsed_emails + hard_ham_parsed_emails + spam_parsed_emails
+    logger.info(f"Parsing & Labeling the data from {', '.join(path for path, _ in folders)} "
+                f"with {workers} worker(s)")
 
     # Specify the output CSV file name
     output_csv_path = os.path.join(output_directory, 'parsed_emails.csv')
-    create_csv_from_parsed_emails(parsed_emails, output_csv_path)
+    logger.info(f"Streaming parsed emails to '{output_csv_path}'")
+
+    max_body_bytes = max_body_bytes or None
+
+    # The cache is invalidated whenever the parser code or its options change
+    cache = None
+    if cache_file and not no_cache:
+        logger.info(f"Using parsed email cache '{cache_file}'")
+        cache = ContentCache(cache_file, 'parsed_emails', cache_version(html_extractor, max_body_bytes))
+
+    # Parsed records are written chunk by chunk instead of being collected first
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        records = (
+            record
+            for folder_path, label in folders
+            for record in iter_email_records(folder_path, label, executor=executor, chunk_size=chunk_size,
+                                             cache=cache, html_extractor=html_extractor,
+                                             max_body_bytes=max_body_bytes)
+        )
+        count = write_records_to_csv(records, output_csv_path)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if cache is not None:
+            cache.close()
+
+    logger.info(f"Saved {count} parsed emails")
+
+
+def write_records_to_csv(records, output_csv_path):
+    """ Writes an iterable of parsed email records to a CSV file and returns how many were written. """
+    count = 0
+    with open(output_csv_path, mode='w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=CSV_HEADERS)
+        writer.writeheader()
+
+        for record in records:
+            writer.writerow(record)
+            count += 1
+    return count
 
 
 def create_csv_from_parsed_emails(parsed_emails, output_csv_path):
     """ Writes parsed emails to a CSV file. """
-    headers = ['Filename', 'Date', 'From', 'To', 'Subject', 'Body', 'Label']
-
-    with open(output_csv_path, mode='w', newline='', encoding='utf-8') as csv_file:
-        writer = csv.DictWriter(csv_file, fieldnames=headers)
-        writer.writeheader()
-
-        for email in parsed_emails:
-            writer.writerow({
-                'Filename': email.filename,
-                'Date': email.Date,
-                'From': email.From,
-                'To': email.To,
-                'Subject': email.Subject,
-                'Body': email.Body,
-                'Label': email.Label
-            })
+    write_records_to_csv((email.to_record() for email in parsed_emails), output_csv_path)
 
 
 if __name__ == '__main__':
     log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     logging.basicConfig(level=logging.INFO, format=log_fmt)
 
+    load_dotenv(find_dotenv())
+    instrumentation.configure_from_env()
+
     # Click command handles the arguments
-    main()
\ No newline at end of file
+    main()
@@ -1,11 +1,25 @@
 import os
-from bs4 import BeautifulSoup
 import re
 import email
+from itertools import islice, repeat
+
+from src import instrumentation
+from src.data import html_text
+from src.data.content_cache import source_version
+from src.data.html_text import DEFAULT_HTML_EXTRACTOR, get_html_extractor
+
+CSV_HEADERS = ['Filename', 'Date', 'From', 'To', 'Subject', 'Body', 'Label']
+CACHED_FIELDS = ['Date', 'From', 'To', 'Subject', 'Body']
+
+# Bodies are truncated to this many bytes before cleaning; spam can carry megabytes of junk markup
+DEFAULT_MAX_BODY_BYTES = 512 * 1024
 
 class ParsedEmail:
-    def __init__(self, raw_email, filename, label=None):
+    def __init__(self, raw_email, filename, label=None, html_extractor=DEFAULT_HTML_EXTRACTOR,
+                 max_body_bytes=DEFAULT_MAX_BODY_BYTES):
         self.raw_email = raw_email
+        self.html_extractor = html_extractor
+        self.max_body_bytes = max_body_bytes
         self.email_message = None
         self.filename = filename
         self.Date = None
@@ -37,20 +51,20 @@ class ParsedEmail:
             for part in self.email_message.walk():
                 # Try to extract plain text first
                 if part.get_content_type() == 'text/plain':
-                    body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
+                    body = self._decode_payload(part)
                     break
                 # If HTML content is found, clean it up
                 elif part.get_content_type() == 'text/html':
-                    html_content = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                    body = self._clean_html(html_content)
+                    html_content = self._decode_payload(part)
+                    body = self._clean_html(html_content, self.html_extractor)
                     break
         else:
             # Handle single-part emails
             if self.email_message.get_content_type() == 'text/plain':
-                body = self.email_message.get_payload(decode=True).decode('utf-8', errors='ignore')
+                body = self._decode_payload(self.email_message)
             elif self.email_message.get_content_type() == 'text/html':
-                html_content = self.email_message.get_payload(decode=True).decode('utf-8', errors='ignore')
-                body = self._clean_html(html_content)
+                html_content = self._decode_payload(self.email_message)
+                body = self._clean_html(html_content, self.html_extractor)
 
         # Clean the body (apply the same cleaning process from earlier)
         body = re.sub(r'^\s*>.*$', '', body, flags=re.MULTILINE)  # Remove quoted text
@@ -59,11 +73,29 @@ class ParsedEmail:
         body = re.sub(r'\s+', ' ', body).strip()  # Normalize whitespace
         return body
 
+    def to_record(self):
+        """Return the parsed fields as a plain dict keyed by the CSV headers."""
+        return {
+            'Filename': self.filename,
+            'Date': self.Date,
+            'From': self.From,
+            'To': self.To,
+            'Subject': self.Subject,
+            'Body': self.Body,
+            'Label': self.Label
+        }
+
+    def _decode_payload(self, part):
+        """Decode a MIME part's payload, truncated to max_body_bytes (None for no limit)."""
+        payload = part.get_payload(decode=True)
+        if self.max_body_bytes is not None:
+            payload = payload[:self.max_body_bytes]
+        return payload.decode('utf-8', errors='ignore')
+
     @staticmethod
-    def _clean_html(html_content):
-        """Removes HTML tags from content using BeautifulSoup"""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        return soup.get_text(separator=' ')
+    def _clean_html(html_content, html_extractor=DEFAULT_HTML_EXTRACTOR):
+        """Removes HTML tags from content with the given extractor ('stdlib', 'regex' or 'bs4')"""
+        return get_html_extractor(html_extractor)(html_content)
 
 
 def read_emails_from_folder(folder_path, label):
@@ -77,4 +109,104 @@ def read_emails_from_folder(folder_path, label):
                 folder_emails.append(parsed_email)
             except Exception as e:
                 print(f"Error reading {filename}: {e}")
-    return folder_emails
\ No newline at end of file
+    return folder_emails
+
+def parse_email_bytes(raw_bytes, filename, label, html_extractor=DEFAULT_HTML_EXTRACTOR,
+                      max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+    """Parse the raw bytes of a single email into a record dict, or return None if it cannot be parsed.
+
+    Only the record is returned, so the raw text and MIME tree are freed as soon as parsing
+    is done. Being a top-level function it can also run in a worker process.
+    """
+    try:
+        raw_email = raw_bytes.decode('utf-8', errors='ignore')
+        return ParsedEmail(raw_email, filename, label, html_extractor, max_body_bytes).to_record()
+    except Exception as e:
+        print(f"Error reading {filename}: {e}")
+        return None
+
+
+def parse_email_file(file_path, label, html_extractor=DEFAULT_HTML_EXTRACTOR, max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+    """Parse a single email file into a record dict, or return None if it cannot be parsed."""
+    with open(file_path, 'rb') as file:
+        raw_bytes = file.read()
+    return parse_email_bytes(raw_bytes, os.path.basename(file_path), label, html_extractor, max_body_bytes)
+
+
+def _parse_chunk_with_cache(chunk, label, executor, cache, options):
+    """Parse a chunk of files, reusing cached records of files whose content was seen before."""
+    contents = []
+    for file_path in chunk:
+        with open(file_path, 'rb') as file:
+            contents.append(file.read())
+    keys = [cache.key(raw_bytes) for raw_bytes in contents]
+    filenames = [os.path.basename(file_path) for file_path in chunk]
+
+    cached = cache.get_many(keys)
+    misses = [i for i, key in enumerate(keys) if key not in cached]
+
+    miss_args = ([contents[i] for i in misses], [filenames[i] for i in misses], repeat(label),
+                 *(repeat(option) for option in options))
+    if executor is None:
+        parsed = list(map(parse_email_bytes, *miss_args))
+    else:
+        parsed = list(executor.map(parse_email_bytes, *miss_args, chunksize=16))
+
+    # Only the content-derived fields are cached; filename and label come from the current file
+    new_entries = []
+    for i, record in zip(misses, parsed):
+        if record is not None:
+            fields = {header: record[header] for header in CACHED_FIELDS}
+            cached[keys[i]] = fields
+            new_entries.append((keys[i], fields))
+    cache.put_many(new_entries)
+
+    for key, filename in zip(keys, filenames):
+        if key in cached:
+            yield dict(cached[key], Filename=filename, Label=label)
+
+
+def cache_version(html_extractor=DEFAULT_HTML_EXTRACTOR, max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+    """Version of cached parsed records; changes whenever the parser code or its options change."""
+    return f"{source_version(__file__, html_text.__file__)}-{html_extractor}-{max_body_bytes}"
+
+
+def parse_email_chunk(file_paths, label, executor=None, cache=None, html_extractor=DEFAULT_HTML_EXTRACTOR,
+                      max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+    """Yield the parsed records of a list of email files, in order, skipping files that cannot be parsed."""
+    options = (html_extractor, max_body_bytes)
+    if instrumentation.enabled():
+        instrumentation.count('bytes_read', sum(os.path.getsize(file_path) for file_path in file_paths))
+
+    with instrumentation.span('parse', items=len(file_paths)):
+        if cache is not None:
+            records = list(_parse_chunk_with_cache(file_paths, label, executor, cache, options))
+        else:
+            args = (file_paths, repeat(label), *(repeat(option) for option in options))
+            if executor is None:
+                records = list(map(parse_email_file, *args))
+            else:
+                records = list(executor.map(parse_email_file, *args, chunksize=16))
+
+    for record in records:
+        if record is not None:
+            yield record
+
+
+def iter_email_records(folder_path, label, executor=None, chunk_size=500, cache=None,
+                       html_extractor=DEFAULT_HTML_EXTRACTOR, max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+    """Yield parsed email records from a folder, in directory order, one bounded chunk at a time.
+
+    With an executor (e.g. a ProcessPoolExecutor) each chunk is parsed in parallel; at most
+    `chunk_size` records are held in memory at once, whatever the size of the folder.
+    With a ContentCache, files whose content hash is already cached are not parsed again;
+    its version must account for the parsing options.
+    """
+    with os.scandir(folder_path) as entries:
+        file_paths = (entry.path for entry in entries if entry.is_file())
+
+        while True:
+            chunk = list(islice(file_paths, chunk_size))
+            if not chunk:
+                break
+            yield from parse_email_chunk(chunk, label, executor, cache, html_extractor, max_body_bytes)
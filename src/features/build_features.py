@@ -2,20 +2,34 @@
 import logging
 import pandas as pd
 import os
+import sys
 import joblib
 from dotenv import load_dotenv, find_dotenv
 
-from preprocessing import preprocess_email_body
-from over_sampling import oversampling_data
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import preprocessing
+from preprocessing import preprocess_many, preprocess_with_cache
 from train_test_split import train_data_split
-from vectorizing import vectorize_text
+# Imported through the package so that pickled vectorizers can be loaded back by train_model and predict_model
+from src.features.vectorizing import build_vectorizer, vectorize_text, matrix_memory
+from src import instrumentation
+from src.data.content_cache import ContentCache, source_version
+from src.features.feature_store import save_feature_set
+from src.features.near_duplicates import deduplicate
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def main(input_filepath, output_processed_filepath, train_filepath, test_filepath, vectorizer_filepath):
-    """ Preprocess, vectorize, oversample, and split the data for model training/testing. """
+def main(input_filepath, output_processed_filepath, train_filepath, test_filepath, vectorizer_filepath, cache_filepath=None,
+         workers=1, feature_backend='tfidf', near_duplicates='group', near_duplicate_threshold=0.8):
+    """ Preprocess, vectorize, and split the data for model training/testing.
+
+        Near-duplicate bodies are dropped or kept on one side of the split, depending on `near_duplicates`.
+        Rebalancing happens at training time, on the training fold only.
+    """
     
     logger.info(f"Reading parsed emails from {input_filepath}")
     df = pd.read_csv(input_filepath)
@@ -23,7 +37,22 @@ def main(input_filepath, output_processed_filepath, train_filepath, test_filepat
     df['Body'] = df['Body'].fillna('')
 
     logger.info(f"Preprocessing email bodies")
-    df['Processed_Body'] = df['Body'].apply(preprocess_email_body)
+    with instrumentation.span('preprocess', items=len(df)):
+        if cache_filepath:
+            # The cache is invalidated whenever the preprocessing code changes
+            with ContentCache(cache_filepath, 'preprocessed_bodies', source_version(preprocessing.__file__)) as cache:
+                df['Processed_Body'] = preprocess_with_cache(df['Body'].tolist(), cache, workers=workers)
+        else:
+            df['Processed_Body'] = preprocess_many(df['Body'].tolist(), workers=workers)
+
+    logger.info(f"Handling near-duplicate email bodies in the '{near_duplicates}' mode")
+    with instrumentation.span('near_duplicates', items=len(df)):
+        keep, groups = deduplicate(df['Processed_Body'].tolist(), near_duplicates, near_duplicate_threshold)
+    if groups is not None:
+        logger.info(f"Keeping {len(df) - len(set(groups))} near-duplicates on the side of the split of their group")
+    if len(keep) < len(df):
+        logger.info(f"Dropping {len(df) - len(keep)} near-duplicates of other emails")
+        df = df.iloc[keep]
 
     logger.info(f"Saving preprocessed email bodies to {output_processed_filepath}")
     df[['Filename', 'Processed_Body']].to_csv(output_processed_filepath, index=False)
@@ -31,19 +60,20 @@ def main(input_filepath, output_processed_filepath, train_filepath, test_filepat
     email_bodies = df['Processed_Body'].tolist()
     labels = df['Label'].tolist()
 
-    X, y, vectorizer = vectorize_text(email_bodies, labels)
-
-    logger.info(f"Oversampling the data...")
-    X_resampled, y_resampled = oversampling_data(X, y)
+    logger.info(f"Vectorizing email bodies with the '{feature_backend}' feature backend")
+    with instrumentation.span('vectorize', items=len(email_bodies)):
+        X, y, vectorizer = vectorize_text(email_bodies, labels, build_vectorizer(feature_backend, n_jobs=workers))
+    logger.info(f"Vectorized features: {matrix_memory(X)}")
 
     logger.info(f"Splitting data into training and testing sets")
-    X_train, X_test, y_train, y_test = train_data_split(X_resampled, y_resampled)
+    X_train, X_test, y_train, y_test = train_data_split(X, y, groups=groups)
+    logger.info(f"Training features: {matrix_memory(X_train)}, testing features: {matrix_memory(X_test)}")
 
-    logger.info(f"Saving training data to {train_filepath}")
-    joblib.dump((X_train, y_train), train_filepath)
+    logger.info(f"Saving training features to {train_filepath}")
+    save_feature_set(train_filepath, X_train, y_train)
 
-    logger.info(f"Saving testing data to {test_filepath}")
-    joblib.dump((X_test, y_test), test_filepath)
+    logger.info(f"Saving testing features to {test_filepath}")
+    save_feature_set(test_filepath, X_test, y_test)
 
     logger.info(f"Saving vectorizer to {vectorizer_filepath}")
     joblib.dump(vectorizer, vectorizer_filepath)
@@ -51,13 +81,20 @@ def main(input_filepath, output_processed_filepath, train_filepath, test_filepat
 
 if __name__ == '__main__':
     load_dotenv(find_dotenv())
+    instrumentation.configure_from_env()
 
     # Define file paths (these can be passed as arguments or via .env)
     input_filepath = os.getenv('INPUT_FILE', 'data/interim/parsed_emails.csv')
     output_processed_filepath = os.getenv('OUTPUT_PROCESSED_FILE', 'data/processed/processed_email.csv')
-    train_filepath = os.getenv('TRAIN_FILE', 'data/processed/train_data.pkl')
-    test_filepath = os.getenv('TEST_FILE', 'data/processed/test_data.pkl')
+    train_filepath = os.getenv('TRAIN_FILE', 'data/processed/train_features')
+    test_filepath = os.getenv('TEST_FILE', 'data/processed/test_features')
     vectorizer_filepath = os.getenv('VECTORIZER_FILE', 'models/tfidf_vectorizer.pkl')
+    cache_filepath = os.getenv('CACHE_FILE', 'data/interim/email_cache.sqlite')  # Set empty to disable
+    workers = int(os.getenv('PREPROCESS_WORKERS', '1'))
+    feature_backend = os.getenv('FEATURE_BACKEND', 'tfidf')  # 'tfidf' or 'hashing'
+    near_duplicates = os.getenv('NEAR_DUPLICATES', 'group')  # 'keep', 'group' or 'drop'
+    near_duplicate_threshold = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.8'))
 
     # Execute the main function
-    main(input_filepath, output_processed_filepath, train_filepath, test_filepath, vectorizer_filepath)
+    main(input_filepath, output_processed_filepath, train_filepath, test_filepath, vectorizer_filepath, cache_filepath,
+         workers, feature_backend, near_duplicates, near_duplicate_threshold)
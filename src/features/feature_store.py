@@ -0,0 +1,244 @@
+import io
+import os
+import json
+import shutil
+import joblib
+import numpy as np
+import scipy.sparse as sp
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+COMPONENTS = ('data', 'indices', 'indptr', 'labels')
+
+
+def _npy_header(dtype, length):
+    """The .npy header of a 1-D array; numpy pads it so its size does not depend on the length."""
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, {'descr': np.dtype(dtype).str, 'fortran_order': False,
+                                                  'shape': (length,)})
+    return header.getvalue()
+
+
+def replace_directory(source, destination):
+    """Move a fully written directory over `destination`, keeping the previous one until it is replaced.
+
+    The previous directory is renamed aside instead of deleted first, so the swap is two renames:
+    readers can only miss `destination` for the instant between them, and a crash in between
+    leaves the previous version at `<destination>.old`. It is deleted once the new one is in place.
+    """
+    aside = f"{destination.rstrip(os.sep)}.old"
+    shutil.rmtree(aside, ignore_errors=True)
+    if os.path.exists(destination):
+        os.replace(destination, aside)
+    os.replace(source, destination)
+    shutil.rmtree(aside, ignore_errors=True)
+
+
+class FeatureSetWriter:
+    """Writes a feature set chunk by chunk, so the whole matrix never has to be in memory.
+
+    Appended rows go straight to the component files, each behind a placeholder .npy header.
+    `close` writes the final headers and the manifest, then renames the directory into place.
+    `state()` describes what has been written so far; a writer created again with that state
+    truncates any rows appended after it and continues from there.
+    """
+
+    def __init__(self, path, n_features, state=None):
+        self.path = path
+        self.n_features = n_features
+        self.temporary_path = f"{path.rstrip(os.sep)}.tmp"
+        self.rows, self.nnz, self.dtypes = 0, 0, {'indices': '<i4', 'indptr': '<i8'}
+        if state is not None:
+            self.rows, self.nnz, self.dtypes = state['rows'], state['nnz'], dict(state['dtypes'])
+        else:
+            shutil.rmtree(self.temporary_path, ignore_errors=True)
+            os.makedirs(self.temporary_path)
+
+        self._files = {}
+        for name in COMPONENTS:
+            if name in self.dtypes:
+                self._open(name)
+        if state is None:
+            self._files['indptr'].write(np.zeros(1, dtype=self.dtypes['indptr']).tobytes())
+
+    def _lengths(self):
+        return {'data': self.nnz, 'indices': self.nnz, 'indptr': self.rows + 1, 'labels': self.rows}
+
+    def _open(self, name):
+        file_path = os.path.join(self.temporary_path, f"{name}.npy")
+        header = _npy_header(self.dtypes[name], 0)
+        if os.path.exists(file_path):
+            f = open(file_path, 'r+b')
+            f.truncate(len(header) + self._lengths()[name] * np.dtype(self.dtypes[name]).itemsize)
+            f.seek(0, os.SEEK_END)
+        else:
+            f = open(file_path, 'wb')
+            f.write(header)
+        self._files[name] = f
+
+    def append(self, X, y):
+        """Append the rows of a sparse matrix and their labels."""
+        X = sp.csr_matrix(X)
+        X.sort_indices()
+        y = np.asarray(y)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Got {X.shape[1]} feature columns, expected {self.n_features}")
+        if len(y) != X.shape[0]:
+            raise ValueError(f"Got {X.shape[0]} rows of features but {len(y)} labels")
+
+        for name, array in (('data', X.data), ('labels', y)):
+            if name not in self.dtypes:
+                self.dtypes[name] = array.dtype.str
+                self._open(name)
+        arrays = {'data': X.data, 'indices': X.indices, 'indptr': X.indptr[1:].astype(np.int64) + self.nnz,
+                  'labels': y}
+        for name, array in arrays.items():
+            self._files[name].write(np.ascontiguousarray(array, dtype=self.dtypes[name]).tobytes())
+        self.rows += X.shape[0]
+        self.nnz += X.nnz
+
+    def state(self):
+        """Flush the files and return a JSON-serializable description of what they hold."""
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        return {'rows': self.rows, 'nnz': self.nnz, 'dtypes': dict(self.dtypes)}
+
+    def close(self):
+        """Finish the feature set and move it to its destination."""
+        for name, array in (('data', np.zeros(0)), ('labels', np.zeros(0, dtype=np.int64))):
+            if name not in self.dtypes:
+                self.dtypes[name] = array.dtype.str
+                self._open(name)
+
+        lengths = self._lengths()
+        for name, f in self._files.items():
+            header = _npy_header(self.dtypes[name], lengths[name])
+            if len(header) != len(_npy_header(self.dtypes[name], 0)):
+                raise ValueError(f"The .npy header of {name} outgrew its placeholder")
+            f.seek(0)
+            f.write(header)
+            f.close()
+        self._files = {}
+
+        # scipy only keeps memory-mapped indices as they are if indptr has the same index type
+        if self.nnz <= np.iinfo(np.int32).max:
+            self._narrow_indptr()
+
+        manifest = {'format_version': FORMAT_VERSION, 'shape': [self.rows, self.n_features], 'nnz': self.nnz,
+                    'components': {name: {'file': f"{name}.npy", 'dtype': self.dtypes[name], 'length': lengths[name]}
+                                   for name in COMPONENTS}}
+        with open(os.path.join(self.temporary_path, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        replace_directory(self.temporary_path, self.path)
+
+    def _narrow_indptr(self, block_size=1_000_000):
+        file_path = os.path.join(self.temporary_path, 'indptr.npy')
+        wide = np.load(file_path, mmap_mode='r')
+        narrow = np.lib.format.open_memmap(f"{file_path}.int32", mode='w+', dtype='<i4', shape=wide.shape)
+        for start in range(0, len(wide), block_size):
+            narrow[start:start + block_size] = wide[start:start + block_size]
+        narrow.flush()
+        del wide, narrow
+        os.replace(f"{file_path}.int32", file_path)
+        self.dtypes['indptr'] = '<i4'
+
+
+def save_feature_set(path, X, y):
+    """Save a feature matrix and its labels as a feature set directory.
+
+    The CSR components and the labels are each written as a plain .npy file, described by a
+    manifest.json, so readers can memory-map them instead of unpickling the whole matrix.
+    The directory is written next to its destination and then swapped in by `replace_directory`.
+    """
+    writer = FeatureSetWriter(path, X.shape[1])
+    writer.append(X, y)
+    writer.close()
+
+
+class FeatureSet:
+    """Read-only view of a feature set directory written by `save_feature_set`.
+
+    Opening only reads the manifest; the arrays are memory-mapped the first time they are
+    used, so opening takes the same time whatever the size of the set, and processes reading
+    the same set share its pages through the OS page cache instead of each holding a copy.
+    """
+
+    def __init__(self, path, mmap_mode='r'):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"{path} has feature set format {self.manifest.get('format_version')}, "
+                             f"expected {FORMAT_VERSION}; rebuild the features")
+        self.shape = tuple(self.manifest['shape'])
+        self._arrays = {}
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _array(self, name):
+        if name not in self._arrays:
+            component = self.manifest['components'][name]
+            array = np.load(os.path.join(self.path, component['file']), mmap_mode=self.mmap_mode)
+            if len(array) != component['length']:
+                raise ValueError(f"{self.path}/{component['file']} is truncated; rebuild the features")
+            self._arrays[name] = array
+        return self._arrays[name]
+
+    @property
+    def X(self):
+        """The whole feature matrix, as a CSR matrix over the memory-mapped components."""
+        return sp.csr_matrix((self._array('data'), self._array('indices'), self._array('indptr')), shape=self.shape,
+                             copy=False)
+
+    @property
+    def y(self):
+        """The labels, one per row."""
+        return self._array('labels')
+
+    def load(self):
+        """Return (X, y) like the train/test tuples used by the models."""
+        return self.X, self.y
+
+    def iter_chunks(self, chunk_size=10_000):
+        """Yield (X, y) for consecutive blocks of at most `chunk_size` rows.
+
+        Each block only touches the pages holding its own rows.
+        """
+        data, indices, indptr, labels = (self._array(name) for name in COMPONENTS)
+        for start in range(0, len(self), chunk_size):
+            stop = min(start + chunk_size, len(self))
+            first, last = indptr[start], indptr[stop]
+            X = sp.csr_matrix((data[first:last], indices[first:last], indptr[start:stop + 1] - first),
+                              shape=(stop - start, self.shape[1]), copy=False)
+            yield X, labels[start:stop]
+
+
+class InMemoryFeatureSet:
+    """The FeatureSet reader API over a matrix and labels already in memory."""
+
+    def __init__(self, X, y):
+        self.X = sp.csr_matrix(X)
+        self.y = np.asarray(y)
+        self.shape = self.X.shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    def load(self):
+        return self.X, self.y
+
+    def iter_chunks(self, chunk_size=10_000):
+        for start in range(0, len(self), chunk_size):
+            yield self.X[start:start + chunk_size], self.y[start:start + chunk_size]
+
+
+def open_feature_set(path, mmap_mode='r'):
+    """Open a feature set directory, or load a train/test tuple pickled by an older build_features."""
+    if os.path.isfile(path):
+        X, y = joblib.load(path)
+        return InMemoryFeatureSet(X, y)
+    return FeatureSet(path, mmap_mode)
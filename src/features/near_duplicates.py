@@ -0,0 +1,128 @@
+import zlib
+import numpy as np
+
+NEAR_DUPLICATE_MODES = ('keep', 'group', 'drop')
+
+# Universal hashing is done modulo 2 ** 32 on 64-bit integers
+_HASH_MASK = np.uint64(0xFFFFFFFF)
+_SHINGLE_MULTIPLIER = np.uint64(0x01000193)
+
+
+class NearDuplicateIndex:
+    """MinHash + LSH index finding stored preprocessed bodies similar to a new one.
+
+    A body's signature is the minimum, over its word shingles, of `num_perm` hash functions; the
+    fraction of equal positions in two signatures estimates the Jaccard similarity of their
+    shingle sets. Signatures are cut into `bands`; bodies sharing any band are candidates, and
+    a candidate matches when its estimated similarity reaches `threshold`.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=3, seed=1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, 2 ** 32, size=(num_perm, 1), dtype=np.uint64)
+        self.b = rng.randint(0, 2 ** 32, size=(num_perm, 1), dtype=np.uint64)
+        self.signatures = {}
+        self.values = {}
+        self.buckets = {}
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def signature(self, processed_body):
+        """MinHash signature of a preprocessed body, or None for an empty one."""
+        tokens = processed_body.encode('utf-8').split()
+        if not tokens:
+            return None
+        # Hash each token once, then combine the hashes of consecutive tokens into shingle hashes
+        hashes = np.fromiter(map(zlib.crc32, tokens), dtype=np.uint64, count=len(tokens))
+        n_shingles = len(tokens) - min(self.shingle_size, len(tokens)) + 1
+        shingles = hashes[:n_shingles].copy()
+        for offset in range(1, min(self.shingle_size, len(tokens))):
+            shingles = (shingles * _SHINGLE_MULTIPLIER + hashes[offset:offset + n_shingles]) & _HASH_MASK
+        # Repeated shingles do not change the minimum, so they need not be removed
+        return ((self.a * shingles + self.b) & _HASH_MASK).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        data, width = signature.tobytes(), self.rows * signature.itemsize
+        return [(band, data[band * width:(band + 1) * width]) for band in range(self.bands)]
+
+    def add(self, signature, value=None):
+        """Store a signature with a value (e.g. a group id or a verdict); returns its id for `remove`."""
+        entry_id = self._next_id
+        self._next_id += 1
+        self.signatures[entry_id] = signature
+        self.values[entry_id] = value
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, []).append(entry_id)
+        return entry_id
+
+    def remove(self, entry_id):
+        signature = self.signatures.pop(entry_id)
+        del self.values[entry_id]
+        for key in self._band_keys(signature):
+            bucket = self.buckets[key]
+            bucket.remove(entry_id)
+            if not bucket:
+                del self.buckets[key]
+
+    def query(self, signature):
+        """Return (value, estimated similarity) of the most similar stored body past the threshold, or None."""
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        if not candidates:
+            return None
+
+        candidates = list(candidates)
+        similarities = (np.stack([self.signatures[entry_id] for entry_id in candidates]) == signature).mean(axis=1)
+        best = int(similarities.argmax())
+        if similarities[best] < self.threshold:
+            return None
+        return self.values[candidates[best]], float(similarities[best])
+
+
+def near_duplicate_groups(processed_bodies, threshold=0.8):
+    """Group id of each preprocessed body; near-duplicates of an earlier body get that body's group.
+
+    Every body is indexed, so chains of near-duplicates end up in one group. Empty bodies each
+    get a group of their own.
+    """
+    index = NearDuplicateIndex(threshold)
+    groups = np.arange(len(processed_bodies))
+    for i, processed_body in enumerate(processed_bodies):
+        signature = index.signature(processed_body)
+        if signature is None:
+            continue
+        match = index.query(signature)
+        if match is not None:
+            groups[i] = match[0]
+        index.add(signature, int(groups[i]))
+    return groups
+
+
+def deduplicate(processed_bodies, mode='group', threshold=0.8):
+    """Apply a near-duplicate handling mode to a corpus before it is split.
+
+    Returns (indices of the bodies to keep, their group ids or None):
+    'keep' keeps every body and splits them independently, 'group' keeps every body but
+    keeps each group of near-duplicates on one side of the split, 'drop' keeps the first
+    body of each group only.
+    """
+    if mode not in NEAR_DUPLICATE_MODES:
+        raise ValueError(f"Unknown near-duplicate mode '{mode}', expected one of {NEAR_DUPLICATE_MODES}")
+    if mode == 'keep':
+        return np.arange(len(processed_bodies)), None
+
+    groups = near_duplicate_groups(processed_bodies, threshold)
+    if mode == 'group':
+        return np.arange(len(processed_bodies)), groups
+    # Each kept body is alone in its group, so a plain split keeps groups together
+    return np.flatnonzero(groups == np.arange(len(processed_bodies))), None
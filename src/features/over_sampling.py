@@ -1,7 +1,81 @@
-from imblearn.over_sampling import SMOTE
+import numpy as np
+import scipy.sparse as sp
+from sklearn.neighbors import NearestNeighbors
+from sklearn.random_projection import SparseRandomProjection
+from sklearn.utils.class_weight import compute_sample_weight
+
+REBALANCE_STRATEGIES = ('none', 'class_weight', 'random', 'smote')
+
+
+def _minority_rows(y):
+    """Yield (row indices, number of rows to add) for each class smaller than the largest one."""
+    classes, counts = np.unique(y, return_counts=True)
+    for cls, count in zip(classes, counts):
+        if count < counts.max():
+            yield np.flatnonzero(y == cls), counts.max() - count
+
+
+def random_oversampling(X, y, random_state=42):
+    """Duplicate randomly chosen rows of the smaller classes until every class is as large as the largest."""
+    rng = np.random.RandomState(random_state)
+    picked = [rng.choice(rows, size=n_new) for rows, n_new in _minority_rows(y)]
+    if not picked:
+        return X, y
+    picked = np.concatenate(picked)
+    return sp.vstack([X, X[picked]], format='csr'), np.concatenate([y, y[picked]])
+
+
+def approximate_smote(X, y, k_neighbors=5, n_components=64, random_state=42):
+    """SMOTE for sparse matrices, with neighbors searched in a low-dimensional random projection.
+
+    Exact SMOTE searches neighbors among all n_features columns. Here rows are first projected
+    to `n_components` dimensions, which roughly preserves their distances, and only the
+    neighbor search runs there. The synthetic rows are interpolated between the original sparse
+    rows, so they stay sparse and live in the real feature space.
+    """
+    rng = np.random.RandomState(random_state)
+    projection = SparseRandomProjection(n_components=n_components, dense_output=True, random_state=random_state)
+    projection.fit(X)
+
+    synthetic_X, synthetic_y = [], []
+    for rows, n_new in _minority_rows(y):
+        if len(rows) < 2:
+            continue
+        X_class = X[rows]
+        neighbors = NearestNeighbors(n_neighbors=min(k_neighbors, len(rows) - 1)).fit(projection.transform(X_class))
+        # Queried without points, every row's neighbors exclude the row itself
+        neighbor_indices = neighbors.kneighbors(return_distance=False)
+
+        base = rng.randint(len(rows), size=n_new)
+        neighbor = neighbor_indices[base, rng.randint(neighbor_indices.shape[1], size=n_new)]
+        gap = rng.uniform(size=n_new)
+        synthetic_X.append(sp.diags(1 - gap) @ X_class[base] + sp.diags(gap) @ X_class[neighbor])
+        synthetic_y.append(np.full(n_new, y[rows[0]]))
+
+    if not synthetic_X:
+        return X, y
+    return sp.vstack([X, *synthetic_X], format='csr'), np.concatenate([y, *synthetic_y])
+
+
+def rebalance(X, y, strategy='smote', random_state=42):
+    """Rebalance a training fold; returns (X, y, sample_weight), sample_weight being None unless weighting.
+
+    Only ever apply this to the training fold: rows made up from training rows must not
+    end up in the test set.
+    """
+    y = np.asarray(y)
+    if strategy == 'none':
+        return X, y, None
+    if strategy == 'class_weight':
+        return X, y, compute_sample_weight('balanced', y)
+    if strategy == 'random':
+        return (*random_oversampling(X, y, random_state), None)
+    if strategy == 'smote':
+        return (*approximate_smote(X, y, random_state=random_state), None)
+    raise ValueError(f"Unknown rebalancing strategy '{strategy}', expected one of {REBALANCE_STRATEGIES}")
+
 
 def oversampling_data(X, y):
-    """Apply SMOTE to oversample the minority class."""
-    smote = SMOTE(sampling_strategy='minority')
-    X_resampled, y_resampled = smote.fit_resample(X, y)
+    """Oversample the smaller classes with approximate SMOTE. Sparse input stays sparse (CSR)."""
+    X_resampled, y_resampled, _ = rebalance(sp.csr_matrix(X), y, 'smote')
     return X_resampled, y_resampled
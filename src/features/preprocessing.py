@@ -1,18 +1,153 @@
 import re
 import logging
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import WordNetLemmatizer
+import threading
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 
-nltk.download('punkt')
-nltk.download('stopwords')
-nltk.download('wordnet')
+logger = logging.getLogger(__name__)
 
-stemmer = WordNetLemmatizer()
-stopwords = set(stopwords.words('english'))
+# NLTK packages used by preprocessing, with the paths they may be installed under. The
+# tokenizer models are only needed by the word_tokenize-based reference implementation.
+NLTK_PACKAGES = {
+    'stopwords': ('corpora/stopwords',),
+    'wordnet': ('corpora/wordnet', 'corpora/wordnet.zip'),
+    'punkt_tab': ('tokenizers/punkt_tab', 'tokenizers/punkt'),
+}
+REQUIRED_NLTK_PACKAGES = ['stopwords', 'wordnet']
+PROVISION_COMMAND = 'python src/features/preprocessing.py'
+
+# NLTK itself is slow to import, so it and its data are only loaded on first use
+_nltk_resources = None
+_nltk_lock = threading.Lock()
+
+
+def verify_nltk_resources(packages=REQUIRED_NLTK_PACKAGES):
+    """Check that the NLTK packages are installed locally, without contacting the network.
+
+    Raises a LookupError naming the missing packages and how to provision them.
+    """
+    import nltk.data
+
+    missing = []
+    for package in packages:
+        for resource_path in NLTK_PACKAGES[package]:
+            try:
+                nltk.data.find(resource_path)
+                break
+            except LookupError:
+                continue
+        else:
+            missing.append(package)
+
+    if missing:
+        raise LookupError(f"Missing NLTK data: {', '.join(missing)}. "
+                          f"Run `{PROVISION_COMMAND}` once to download it.")
+
+
+def load_nltk_resources():
+    """Return the default (lemmatizer, stop words), loading them once on first use."""
+    global _nltk_resources
+    with _nltk_lock:
+        if _nltk_resources is None:
+            verify_nltk_resources()
+            from nltk.corpus import stopwords
+            from nltk.stem import WordNetLemmatizer
+            _nltk_resources = (WordNetLemmatizer(), frozenset(stopwords.words('english')))
+    return _nltk_resources
+
+
+def provision_nltk_resources(download_dir=None):
+    """Download every NLTK package used by preprocessing. Meant to be run once per machine."""
+    import nltk
+
+    for package in NLTK_PACKAGES:
+        if not nltk.download(package, download_dir=download_dir, quiet=True, raise_on_error=True):
+            raise RuntimeError(f"Could not download NLTK package '{package}'")
+    verify_nltk_resources(list(NLTK_PACKAGES))
+
+
+PUNCTUATION_RE = re.compile(r'[^\w\s]')
+
+# Once punctuation is stripped, word_tokenize only splits on whitespace, except for these
+# contractions which its Treebank rules always break in two
+SPLIT_CONTRACTIONS = {
+    'cannot': ('can', 'not'),
+    'gimme': ('gim', 'me'),
+    'gonna': ('gon', 'na'),
+    'gotta': ('got', 'ta'),
+    'lemme': ('lem', 'me'),
+    'wanna': ('wan', 'na'),
+}
+
+
+class Preprocessor:
+    """Compiled preprocessing pipeline producing the same output as `preprocess_email_body_nltk`.
+
+    Tokenizes with a precompiled regex instead of word_tokenize, and memoizes token -> lemma
+    in a bounded LRU cache; mail vocabulary is Zipfian, so most lookups are cache hits.
+    A lemmatizer or stop words left as None default to NLTK's, loaded on first use.
+    """
+
+    def __init__(self, lemmatizer=None, stop_words=None, cache_size=100_000):
+        self.lemmatizer = lemmatizer
+        self.stop_words = None if stop_words is None else frozenset(stop_words)
+        self.cache_size = cache_size
+        self._lemmatize = None
+        self._stop_words = None
+
+    def _load(self):
+        lemmatizer, stop_words = self.lemmatizer, self.stop_words
+        if lemmatizer is None or stop_words is None:
+            default_lemmatizer, default_stop_words = load_nltk_resources()
+            lemmatizer = default_lemmatizer if lemmatizer is None else lemmatizer
+            stop_words = default_stop_words if stop_words is None else stop_words
+        self._stop_words = stop_words
+        self._lemmatize = lru_cache(maxsize=self.cache_size)(lemmatizer.lemmatize)
+
+    def tokenize(self, body):
+        """Lowercase, strip punctuation and split into tokens like word_tokenize would."""
+        tokens = []
+        for token in PUNCTUATION_RE.sub('', body.lower()).split():
+            parts = SPLIT_CONTRACTIONS.get(token)
+            if parts is None:
+                tokens.append(token)
+            else:
+                tokens.extend(parts)
+        return tokens
+
+    def __call__(self, body):
+        if self._lemmatize is None:
+            self._load()
+        lemmatize = self._lemmatize
+        stop_words = self._stop_words
+        return ' '.join([lemmatize(word) for word in self.tokenize(body) if word not in stop_words])
+
+    def cache_info(self):
+        """Return the hit/miss statistics of the lemma cache."""
+        if self._lemmatize is None:
+            self._load()
+        return self._lemmatize.cache_info()
+
+    def __getstate__(self):
+        # The loaded resources and LRU wrapper are not pickled; they are reloaded on first use
+        state = self.__dict__.copy()
+        state['_lemmatize'] = None
+        state['_stop_words'] = None
+        return state
+
+
+default_preprocessor = Preprocessor()
+
+
+def preprocess_email_body_nltk(body, l=None, stop_words=None):
+    """Reference implementation using word_tokenize and uncached lemmatization."""
+    from nltk.tokenize import word_tokenize
+
+    if l is None or stop_words is None:
+        default_lemmatizer, default_stop_words = load_nltk_resources()
+        l = default_lemmatizer if l is None else l
+        stop_words = default_stop_words if stop_words is None else stop_words
 
-def preprocess_email_body(body, l=stemmer, stop_words=stopwords):
     # 1. Lowercasing
     body = body.lower()
 
@@ -27,4 +162,52 @@ def preprocess_email_body(body, l=stemmer, stop_words=stopwords):
 
     # Join tokens back into a string
     output = ' '.join(processed_tokens)
-    return output
\ No newline at end of file
+    return output
+
+
+def preprocess_email_body(body, l=None, stop_words=None):
+    """Lowercase, strip punctuation, tokenize, drop stop words and lemmatize an email body."""
+    if l is None and stop_words is None:
+        return default_preprocessor(body)
+    return Preprocessor(l, stop_words)(body)
+
+
+def preprocess_many(bodies, workers=1, chunksize=256):
+    """Preprocess a list of email bodies, fanning out across `workers` processes if more than one."""
+    if workers <= 1:
+        return [default_preprocessor(body) for body in bodies]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(preprocess_email_body, bodies, chunksize=chunksize))
+
+
+def preprocess_with_cache(bodies, cache, workers=1):
+    """ Preprocess email bodies, reusing cached results for bodies whose content hash was seen before. """
+    keys = [cache.key(body) for body in bodies]
+    cached = cache.get_many(keys)
+    hits = sum(key in cached for key in keys)
+
+    misses = {}
+    for key, body in zip(keys, bodies):
+        if key not in cached:
+            misses.setdefault(key, body)
+    new_entries = dict(zip(misses, preprocess_many(list(misses.values()), workers=workers)))
+    cache.put_many(new_entries.items())
+    cached.update(new_entries)
+
+    logger.info(f"Preprocessed {len(new_entries)} new unique email bodies, {hits} of {len(bodies)} served from the cache")
+    return [cached[key] for key in keys]
+
+
+if __name__ == '__main__':
+    import click
+
+    @click.command()
+    @click.option('--download-dir', default=None, type=click.Path(),
+                  help='Where to put the NLTK data (defaults to the NLTK data path).')
+    def main(download_dir):
+        """ Downloads the NLTK data used by preprocessing, so later runs can work offline. """
+        provision_nltk_resources(download_dir)
+        print(f"NLTK data ready: {', '.join(NLTK_PACKAGES)}")
+
+    main()
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import csv
+import json
+import click
+import shutil
+import joblib
+import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv, find_dotenv
+
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.features import preprocessing
+from src.features.preprocessing import preprocess_many, preprocess_with_cache
+# Imported through the package so that the pickled vectorizer can be loaded back by train_model and predict_model
+from src.features.vectorizing import HashingTfidfVectorizer
+from src import instrumentation
+from src.features.feature_store import FeatureSetWriter, open_feature_set
+from src.data.content_cache import ContentCache, content_hash, source_version
+from src.data.parse_email import CSV_HEADERS, cache_version, parse_email_chunk
+from src.data.make_dataset import LABELLED_FOLDERS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = 'checkpoint.json'
+DOCUMENT_FREQUENCIES_FILE = 'document_frequencies.npy'
+PROCESSED_CSV_HEADERS = ['Filename', 'Processed_Body']
+SPLITS = ('train', 'test')
+
+
+def email_chunks(input_directory, chunk_size, skip=0):
+    """Yield (label, file paths) chunks of the labelled raw folders in a stable order, after the first `skip` files."""
+    for folder, label in LABELLED_FOLDERS:
+        folder_path = os.path.join(input_directory, folder)
+        with os.scandir(folder_path) as entries:
+            file_paths = sorted(entry.path for entry in entries if entry.is_file())
+        if skip >= len(file_paths):
+            skip -= len(file_paths)
+            continue
+
+        file_paths, skip = file_paths[skip:], 0
+        for start in range(0, len(file_paths), chunk_size):
+            yield label, file_paths[start:start + chunk_size]
+
+
+def is_test_email(body, test_size):
+    """Assign an email to the test split from a hash of its body.
+
+    The split needs no shuffle of the whole corpus, does not depend on chunking, and puts
+    identical bodies on the same side.
+    """
+    return int(content_hash(body)[:8], 16) < test_size * 16 ** 8
+
+
+def load_checkpoint(work_directory, config):
+    """Return the saved stream state and document frequencies, or None if there is none for this config."""
+    checkpoint_path = os.path.join(work_directory, CHECKPOINT_FILE)
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        state = json.load(f)
+    if state['config'] != config:
+        logger.info(f"Ignoring the checkpoint in {work_directory}: it was made with other settings")
+        return None
+    return state, np.load(os.path.join(work_directory, DOCUMENT_FREQUENCIES_FILE))
+
+
+def save_checkpoint(work_directory, state, document_frequencies):
+    """Save the stream state; both files are replaced atomically, the state last."""
+    frequencies_path = os.path.join(work_directory, DOCUMENT_FREQUENCIES_FILE)
+    with open(f"{frequencies_path}.tmp", 'wb') as f:
+        np.save(f, document_frequencies)
+    os.replace(f"{frequencies_path}.tmp", frequencies_path)
+
+    checkpoint_path = os.path.join(work_directory, CHECKPOINT_FILE)
+    with open(f"{checkpoint_path}.tmp", 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+
+def open_debug_csv(csv_path, fieldnames, offset=None):
+    """Open an optional debug CSV output, truncated back to `offset` when resuming."""
+    if offset is None:
+        csv_file = open(csv_path, mode='w', newline='', encoding='utf-8')
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+    else:
+        csv_file = open(csv_path, mode='r+', newline='', encoding='utf-8')
+        csv_file.truncate(offset)
+        csv_file.seek(offset)
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+    return csv_file, writer
+
+
+def stream_features(input_directory, train_filepath, test_filepath, vectorizer_filepath, work_directory,
+                    chunk_size=1000, workers=1, test_size=0.3, n_features=2 ** 18, cache_filepath=None,
+                    checkpoint=True, parsed_csv=None, processed_csv=None):
+    """ Featurize the raw emails in one pass, parsing, preprocessing and hashing one chunk at a time.
+
+        Each chunk's hashed term counts are appended to a train or test feature set in
+        `work_directory`, and the training document frequencies are accumulated alongside.
+        Once every email is counted, the IDF weights are fitted from those frequencies and the
+        count sets are weighted chunk by chunk into the final feature sets.
+    """
+    config = {'input_directory': os.path.abspath(input_directory), 'test_size': test_size, 'n_features': n_features,
+              'parser': cache_version(), 'preprocessing': source_version(preprocessing.__file__)}
+    resumed = load_checkpoint(work_directory, config) if checkpoint else None
+    if resumed is None:
+        shutil.rmtree(work_directory, ignore_errors=True)
+        os.makedirs(work_directory)
+        state = {'config': config, 'files_done': 0, 'train_documents': 0, 'writers': dict.fromkeys(SPLITS),
+                 'csv_offsets': {}}
+        document_frequencies = np.zeros(n_features, dtype=np.int64)
+    else:
+        state, document_frequencies = resumed
+        logger.info(f"Resuming from the checkpoint in {work_directory} after {state['files_done']} files")
+
+    count_paths = {split: os.path.join(work_directory, f"{split}_counts") for split in SPLITS}
+    vectorizer = HashingTfidfVectorizer(n_features=n_features, n_jobs=workers)
+    if state.get('counts_closed'):
+        # The previous run was stopped while weighting; finish moving any count sets it had not closed
+        for split in SPLITS:
+            if not os.path.isdir(count_paths[split]):
+                FeatureSetWriter(count_paths[split], n_features, state['writers'][split]).close()
+    else:
+        writers = {split: FeatureSetWriter(count_paths[split], n_features, state['writers'][split])
+                   for split in SPLITS}
+
+        debug_outputs = {}
+        for name, csv_path, fieldnames in (('parsed', parsed_csv, CSV_HEADERS),
+                                           ('processed', processed_csv, PROCESSED_CSV_HEADERS)):
+            if csv_path:
+                debug_outputs[name] = open_debug_csv(csv_path, fieldnames, state['csv_offsets'].get(name))
+
+        parsed_cache = preprocessed_cache = None
+        if cache_filepath:
+            parsed_cache = ContentCache(cache_filepath, 'parsed_emails', cache_version())
+            preprocessed_cache = ContentCache(cache_filepath, 'preprocessed_bodies',
+                                              source_version(preprocessing.__file__))
+
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            for label, file_paths in email_chunks(input_directory, chunk_size, skip=state['files_done']):
+                records = list(parse_email_chunk(file_paths, label, executor=executor, cache=parsed_cache))
+                bodies = [record['Body'] or '' for record in records]
+                with instrumentation.span('preprocess', items=len(bodies)):
+                    if preprocessed_cache is not None:
+                        processed_bodies = preprocess_with_cache(bodies, preprocessed_cache, workers=workers)
+                    else:
+                        processed_bodies = preprocess_many(bodies, workers=workers)
+
+                with instrumentation.span('vectorize', items=len(bodies)):
+                    counts = vectorizer.hash_counts(processed_bodies)
+                labels = np.array([record['Label'] for record in records], dtype=np.int64)
+                in_test = np.array([is_test_email(body, test_size) for body in bodies], dtype=bool)
+
+                train_counts = counts[~in_test]
+                writers['train'].append(train_counts, labels[~in_test])
+                writers['test'].append(counts[in_test], labels[in_test])
+                document_frequencies += np.bincount(train_counts.indices, minlength=n_features)
+                state['train_documents'] += train_counts.shape[0]
+                state['files_done'] += len(file_paths)
+
+                if 'parsed' in debug_outputs:
+                    debug_outputs['parsed'][1].writerows(records)
+                if 'processed' in debug_outputs:
+                    debug_outputs['processed'][1].writerows(
+                        {'Filename': record['Filename'], 'Processed_Body': processed_body}
+                        for record, processed_body in zip(records, processed_bodies))
+
+                if checkpoint:
+                    state['writers'] = {split: writer.state() for split, writer in writers.items()}
+                    for name, (csv_file, _) in debug_outputs.items():
+                        csv_file.flush()
+                        state['csv_offsets'][name] = csv_file.tell()
+                    save_checkpoint(work_directory, state, document_frequencies)
+                logger.info(f"Streamed {state['files_done']} emails ({writers['train'].rows} training, "
+                            f"{writers['test'].rows} testing)")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            for cache in (parsed_cache, preprocessed_cache):
+                if cache is not None:
+                    cache.close()
+            for csv_file, _ in debug_outputs.values():
+                csv_file.close()
+
+        # Checkpointed before closing, as closing moves the count sets away from the paths in the writer states
+        state['writers'] = {split: writer.state() for split, writer in writers.items()}
+        state['counts_closed'] = True
+        if checkpoint:
+            save_checkpoint(work_directory, state, document_frequencies)
+        for writer in writers.values():
+            writer.close()
+
+    logger.info(f"Fitting the IDF weights on {state['train_documents']} training emails")
+    vectorizer.fit_document_frequencies(document_frequencies, state['train_documents'])
+
+    for split, output_filepath in zip(SPLITS, (train_filepath, test_filepath)):
+        logger.info(f"Saving {split}ing features to {output_filepath}")
+        output = FeatureSetWriter(output_filepath, n_features)
+        for X, y in open_feature_set(count_paths[split]).iter_chunks(chunk_size):
+            with instrumentation.span('idf_weighting', items=X.shape[0]):
+                output.append(vectorizer.idf.transform(X), y)
+        output.close()
+
+    logger.info(f"Saving vectorizer to {vectorizer_filepath}")
+    joblib.dump(vectorizer, vectorizer_filepath)
+    shutil.rmtree(work_directory)
+
+
+@click.command()
+@click.argument('input_directory', default='data/raw', type=click.Path(exists=True))
+@click.option('--chunk-size', default=1000, show_default=True, type=click.IntRange(min=1),
+              help='Number of emails parsed, preprocessed and hashed together; bounds peak memory.')
+@click.option('--workers', default=1, show_default=True, type=click.IntRange(min=1),
+              help='Number of processes parsing and preprocessing emails in parallel.')
+@click.option('--test-size', default=0.3, show_default=True, type=click.FloatRange(0, 1),
+              help='Fraction of emails assigned to the test split.')
+@click.option('--n-features', default=2 ** 18, show_default=True, type=click.IntRange(min=1),
+              help='Number of hashed feature columns.')
+@click.option('--work-dir', default='data/interim/stream_features', show_default=True, type=click.Path(),
+              help='Directory for the intermediate counts and the checkpoint.')
+@click.option('--no-checkpoint', is_flag=True, help='Do not save progress after each chunk, nor resume from it.')
+@click.option('--no-cache', is_flag=True, help='Parse and preprocess every email, ignoring the content cache.')
+@click.option('--parsed-csv', type=click.Path(), help='Also write the parsed emails to this CSV, for debugging.')
+@click.option('--processed-csv', type=click.Path(), help='Also write the preprocessed bodies to this CSV, for debugging.')
+def main(input_directory, chunk_size, workers, test_size, n_features, work_dir, no_checkpoint, no_cache, parsed_csv,
+         processed_csv):
+    """ Streams raw emails from INPUT_DIRECTORY straight into the train and test feature sets,
+        without the parsed and processed CSV round-trips of make_dataset and build_features.
+    """
+    train_filepath = os.getenv('TRAIN_FILE', 'data/processed/train_features')
+    test_filepath = os.getenv('TEST_FILE', 'data/processed/test_features')
+    vectorizer_filepath = os.getenv('VECTORIZER_FILE', 'models/tfidf_vectorizer.pkl')
+    cache_filepath = None if no_cache else os.getenv('CACHE_FILE', 'data/interim/email_cache.sqlite')
+
+    stream_features(input_directory, train_filepath, test_filepath, vectorizer_filepath, work_dir, chunk_size, workers,
+                    test_size, n_features, cache_filepath, not no_checkpoint, parsed_csv, processed_csv)
+
+
+if __name__ == '__main__':
+    load_dotenv(find_dotenv())
+    instrumentation.configure_from_env()
+
+    # Click command handles the arguments
+    main()
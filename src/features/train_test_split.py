@@ -1,6 +1,18 @@
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, StratifiedGroupKFold
 
-def train_data_split(X, y, test_size=0.3, random_state=42):
-    """Split the data into training and testing sets."""
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=random_state)
+def train_data_split(X, y, test_size=0.3, random_state=42, groups=None):
+    """Split the data into training and testing sets, keeping the class proportions in both.
+
+    With `groups` (e.g. near-duplicate groups), the rows of a group all land on the same side instead:
+    the test set is one fold of a StratifiedGroupKFold, like the folds of search_models, so its share
+    is 1 / round(1 / test_size) of the rows and the class proportions are kept as far as the groups allow.
+    """
+    if groups is not None:
+        splitter = StratifiedGroupKFold(n_splits=max(2, round(1 / test_size)), shuffle=True,
+                                        random_state=random_state)
+        train_index, test_index = next(splitter.split(X, y, groups))
+        return X[train_index], X[test_index], y[train_index], y[test_index]
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=random_state,
+                                                        stratify=y)
     return X_train, X_test, y_train, y_test
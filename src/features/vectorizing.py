@@ -1,10 +1,85 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer, TfidfTransformer
+from joblib import Parallel, delayed
 import numpy as np
+import scipy.sparse as sp
+
+FEATURE_BACKENDS = ('tfidf', 'hashing')
 
 vectorizer = TfidfVectorizer(max_features=5000)
 
+
+class HashingTfidfVectorizer:
+    """TF-IDF features computed with feature hashing instead of a fitted vocabulary.
+
+    Tokens are hashed straight into `n_features` columns, so there is no vocabulary to build,
+    store or look up, and memory stays bounded however large the corpus grows. Only the IDF
+    weight vector is fitted. Hashing is stateless, so batches can be transformed in parallel.
+    """
+
+    def __init__(self, n_features=2 ** 18, n_jobs=1, chunk_size=1000):
+        self.n_features = n_features
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.hasher = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None)
+        self.idf = TfidfTransformer()
+
+    def hash_counts(self, raw_documents, n_jobs=None):
+        """Hash documents into a sparse matrix of raw term counts, before IDF weighting."""
+        n_jobs = self.n_jobs if n_jobs is None else n_jobs
+        raw_documents = list(raw_documents)
+        if n_jobs == 1 or len(raw_documents) <= self.chunk_size:
+            return self.hasher.transform(raw_documents)
+
+        chunks = [raw_documents[i:i + self.chunk_size] for i in range(0, len(raw_documents), self.chunk_size)]
+        counts = Parallel(n_jobs=n_jobs)(delayed(self.hasher.transform)(chunk) for chunk in chunks)
+        return sp.vstack(counts, format='csr')
+
+    def fit(self, raw_documents, y=None):
+        self.idf.fit(self.hash_counts(raw_documents))
+        return self
+
+    def fit_document_frequencies(self, document_frequencies, n_documents):
+        """Fit the IDF weights from per-column document frequencies counted over `n_documents`.
+
+        Lets a corpus streamed through `hash_counts` chunk by chunk be fitted without holding all
+        of its counts at once; the weights are those `fit` gives on the same documents.
+        """
+        # Same smoothed formula as TfidfTransformer.fit
+        df = np.asarray(document_frequencies, dtype=np.float64) + 1
+        self.idf.idf_ = np.log((n_documents + 1) / df) + 1
+        self.idf.n_features_in_ = self.n_features
+        return self
+
+    def fit_transform(self, raw_documents, y=None):
+        counts = self.hash_counts(raw_documents)
+        return self.idf.fit(counts).transform(counts)
+
+    def transform(self, raw_documents, n_jobs=None):
+        return self.idf.transform(self.hash_counts(raw_documents, n_jobs))
+
+
+def build_vectorizer(backend='tfidf', max_features=5000, n_features=2 ** 18, n_jobs=1):
+    """Create an unfitted vectorizer for the given feature backend ('tfidf' or 'hashing')."""
+    if backend == 'tfidf':
+        return TfidfVectorizer(max_features=max_features)
+    if backend == 'hashing':
+        return HashingTfidfVectorizer(n_features=n_features, n_jobs=n_jobs)
+    raise ValueError(f"Unknown feature backend '{backend}', expected one of {FEATURE_BACKENDS}")
+
+
 def vectorize_text(email_bodies: list, labels: list, vectorizer: TfidfVectorizer = vectorizer):
-    vectorized_emails = vectorizer.fit_transform(email_bodies).toarray()
+    # Keep the TF-IDF matrix sparse (CSR); densifying costs n_features * 8 bytes per email
+    vectorized_emails = vectorizer.fit_transform(email_bodies).tocsr()
     y = np.array(labels)
-    
-    return vectorized_emails, y, vectorizer
\ No newline at end of file
+
+    return vectorized_emails, y, vectorizer
+
+
+def matrix_memory(X):
+    """Describe the memory held by a dense array or sparse matrix, e.g. for logging."""
+    if sp.issparse(X):
+        X = X.tocsr()
+        nbytes = X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+        density = X.nnz / max(1, X.shape[0] * X.shape[1])
+        return f"{X.shape[0]}x{X.shape[1]} sparse, {nbytes / 1024 ** 2:.1f} MB ({density:.2%} non-zero)"
+    return f"{X.shape[0]}x{X.shape[1]} dense, {X.nbytes / 1024 ** 2:.1f} MB"
@@ -1,22 +1,118 @@
 import sys
 import os
-import joblib
+import queue
 import random
+import threading
 import tkinter as tk
+from functools import lru_cache
 from tkinter import messagebox
+from dotenv import load_dotenv, find_dotenv
 
 # Add the root directory to sys.path so that Python can find the src module
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from src.models.predict_model import predict_email_class  # Now this import will work
+from src.models.predict_model import get_classifier  # Now this import will work
+from src import instrumentation
 
-# Load the trained vectorizer and model
-vectorizer_filepath = 'models/tfidf_vectorizer.pkl'  # Path to the saved vectorizer file
-model_filepath = 'models/spam_classifier_model.pkl'  # Updated model file path
+load_dotenv(find_dotenv())
+
+# Opt-in timings of the predictions, configured by the INSTRUMENTATION_* environment variables
+instrumentation.configure_from_env()
+
+# The trained pipeline: a pipeline pickle or a compact artifact directory
+pipeline_filepath = os.getenv('PREDICTION_PIPELINE', 'models/spam_pipeline.pkl')
+
+# Example emails, read and split once at startup
+example_files = {
+    'spam': 'data/example-emails/spam_emails.txt',
+    'ham': 'data/example-emails/ham_emails.txt',
+}
+
+LIVE_PREDICTION_DELAY_MS = 400  # Wait for a pause in typing before a live prediction
+RESULT_POLL_MS = 50  # How often the main loop picks up results from the worker
+
+# Inference runs on a background thread; the Tk main loop only ever touches widgets
+prediction_requests = queue.Queue()
+prediction_results = queue.Queue()
+latest_request_id = 0
+live_prediction_job = None
+loaded_classifier = None  # Only used by the worker thread
+
+@lru_cache(maxsize=256)
+def cached_prediction(email_body):
+    """Predict an email body with the loaded classifier, answering repeated bodies from a small LRU cache."""
+    return loaded_classifier.predict(email_body)
+
+def use_classifier(classifier):
+    """Predict with this classifier from now on; a reloaded model clears the cache of the previous one's answers."""
+    global loaded_classifier
+    if classifier is not loaded_classifier:
+        loaded_classifier = classifier
+        cached_prediction.cache_clear()
+
+def prediction_worker():
+    """Load the model once, then score queued email bodies until the app exits."""
+    try:
+        use_classifier(get_classifier(pipeline_filepath))
+    except Exception as e:
+        prediction_results.put((None, e, False))
+
+    while True:
+        request_id, email_body, refresh_examples = prediction_requests.get()
+        try:
+            # Only the newest request matters; skip any the user has already typed past
+            if request_id == latest_request_id:
+                use_classifier(get_classifier(pipeline_filepath))
+                prediction_results.put((request_id, cached_prediction(email_body), refresh_examples))
+        except Exception as e:
+            prediction_results.put((request_id, e, False))
+
+def poll_prediction_results():
+    """Show results posted by the worker, then check again shortly."""
+    while True:
+        try:
+            request_id, result, refresh_examples = prediction_results.get_nowait()
+        except queue.Empty:
+            break
+
+        if request_id is not None and request_id != latest_request_id:
+            continue  # The text changed since this prediction was requested
+
+        if isinstance(result, Exception):
+            prediction_label.config(text=f"Error: {str(result)}")
+        else:
+            label, confidence = result
+            prediction_label.config(text=f"Prediction: {label} (Confidence: {confidence:.2f})")
+            if refresh_examples:
+                update_example_texts()  # Change examples after each prediction
+
+    root.after(RESULT_POLL_MS, poll_prediction_results)
+
+def request_prediction(email_body, refresh_examples):
+    """Queue an email body for the background worker."""
+    global latest_request_id
+    latest_request_id += 1
+    prediction_requests.put((latest_request_id, email_body, refresh_examples))
 
 def clear_prediction(event):
-    """Clear the prediction label when the email body is changed."""
+    """Clear the prediction label when the email body is changed, and schedule a live prediction."""
+    global latest_request_id, live_prediction_job
     prediction_label.config(text="")
+    latest_request_id += 1  # Results for the previous text are now stale
+
+    if live_prediction_job is not None:
+        root.after_cancel(live_prediction_job)
+        live_prediction_job = None
+    if live_prediction.get():
+        live_prediction_job = root.after(LIVE_PREDICTION_DELAY_MS, predict_live)
+
+def predict_live():
+    """Predict the current text once the user has paused typing."""
+    global live_prediction_job
+    live_prediction_job = None
+    email_body = email_entry.get("1.0", 'end-1c').strip()
+    if email_body:
+        request_prediction(email_body, refresh_examples=False)
 
 def predict_spam():
     """Predict whether the email is spam or not, and show the confidence score."""
@@ -25,25 +121,18 @@ def predict_spam():
         messagebox.showwarning("Input Error", "Please enter an email body!")
         return
 
-    # Call the prediction function with the file paths, not loaded objects
-    try:
-        label, confidence = predict_email_class(email_body, vectorizer_filepath, model_filepath)
-        prediction_label.config(text=f"Prediction: {label} (Confidence: {confidence:.2f})")
-        update_example_texts()  # Change examples after each prediction
-    except Exception as e:
-        prediction_label.config(text=f"Error: {str(e)}")
+    prediction_label.config(text="Predicting...")
+    request_prediction(email_body, refresh_examples=True)
 
-def load_random_example(file_path):
-    """Load a random email example from the provided file."""
+def load_examples(file_path):
+    """Load all email examples from the provided file."""
     with open(file_path, 'r') as f:
-        emails = f.read().strip().split("\n\n")
-    
-    return random.choice(emails)  # Return a random email from the file
+        return f.read().strip().split("\n\n")
 
 def update_example_texts():
     """Update the examples in the spam and ham text boxes with new random examples."""
-    spam_example = load_random_example('data/example-emails/spam_emails.txt')
-    ham_example = load_random_example('data/example-emails/ham_emails.txt')
+    spam_example = random.choice(examples['spam'])
+    ham_example = random.choice(examples['ham'])
 
     # Update spam example text
     spam_text.config(state=tk.NORMAL)  # Enable editing temporarily
@@ -57,6 +146,11 @@ def update_example_texts():
     ham_text.insert(tk.END, ham_example)
     ham_text.config(state=tk.DISABLED)
 
+examples = {kind: load_examples(file_path) for kind, file_path in example_files.items()}
+
+# Start loading the model in the background while the window is built
+threading.Thread(target=prediction_worker, daemon=True).start()
+
 # Create the GUI
 root = tk.Tk()
 root.title("Email Spam Prediction")
@@ -84,13 +178,17 @@ tk.Label(input_frame, text="Enter the email body:", font=header_font, bg="#f4f4f
 email_entry = tk.Text(input_frame, height=10, width=50, font=normal_font, bg="#ffffff", bd=0, relief="flat")
 email_entry.pack(pady=10)
 
-# Add a listener to clear the prediction when the email body is modified
+# Add a listener to clear the prediction when the email body is modified (and predict live, if enabled)
 email_entry.bind("<Key>", clear_prediction)
 
 # Predict button at the bottom center
 predict_button = tk.Button(input_frame, text="Predict Spam", font=subheader_font, bg="#4caf50", fg="white", padx=10, pady=5, relief="flat", command=predict_spam)
 predict_button.pack(pady=10)
 
+# Toggle for predicting while typing
+live_prediction = tk.BooleanVar(value=False)
+tk.Checkbutton(input_frame, text="Predict as I type", variable=live_prediction, font=normal_font, bg="#f4f4f9").pack()
+
 # Label to display the prediction result
 prediction_label = tk.Label(input_frame, text="", font=normal_font, bg="#f4f4f9")
 prediction_label.pack(pady=20)
@@ -120,5 +218,8 @@ ham_text.pack(pady=5)
 # Update the text boxes with random examples when the app starts
 update_example_texts()
 
+# Pick up prediction results from the background worker
+root.after(RESULT_POLL_MS, poll_prediction_results)
+
 # Run the GUI loop
 root.mainloop()
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import atexit
+import cProfile
+import threading
+import functools
+import tracemalloc
+from bisect import bisect_left
+from contextlib import nullcontext
+
+# Upper bounds of the histogram buckets, in seconds for durations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+METRIC_PREFIX = 'spam_detection_'
+
+# Returned by `span` while instrumentation is disabled, so a disabled span costs one function call
+_NULL_SPAN = nullcontext()
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as in the Prometheus text format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Instrumentation:
+    """Process-wide counters, histograms and exporters; disabled until `configure` enables it."""
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.jsonl_file = None
+        self.prometheus_path = None
+        self.profile_stages = frozenset()
+        self.tracemalloc_stages = frozenset()
+        self.profile_dir = None
+        self.profiling = False
+        self.profile_runs = 0
+
+    def wants(self, stages, name):
+        return name in stages or '*' in stages
+
+
+_state = _Instrumentation()
+
+
+def configure(jsonl_path=None, prometheus_path=None, profile_stages=(), tracemalloc_stages=(),
+              profile_dir='logs/profiles'):
+    """Enable instrumentation, exporting to a JSON lines file and/or a Prometheus text file.
+
+    Stages named in `profile_stages` run under cProfile (stats saved in `profile_dir`), and those
+    in `tracemalloc_stages` record their peak traced memory; '*' selects every stage. With no
+    exporter and no stage selected, instrumentation stays disabled.
+    """
+    flush()
+    with _state.lock:
+        if _state.jsonl_file is not None:
+            _state.jsonl_file.close()
+        _state.jsonl_file = None
+        if jsonl_path:
+            os.makedirs(os.path.dirname(jsonl_path) or '.', exist_ok=True)
+            _state.jsonl_file = open(jsonl_path, 'a', encoding='utf-8')
+        _state.prometheus_path = prometheus_path or None
+        _state.profile_stages = frozenset(profile_stages)
+        _state.tracemalloc_stages = frozenset(tracemalloc_stages)
+        _state.profile_dir = profile_dir
+        _state.enabled = bool(jsonl_path or prometheus_path or _state.profile_stages or _state.tracemalloc_stages)
+
+
+def configure_from_env():
+    """Configure instrumentation from the INSTRUMENTATION_* and PROFILE_* environment variables."""
+    def stages(variable):
+        return [stage.strip() for stage in os.getenv(variable, '').split(',') if stage.strip()]
+
+    configure(jsonl_path=os.getenv('INSTRUMENTATION_JSONL'),
+              prometheus_path=os.getenv('INSTRUMENTATION_PROMETHEUS'),
+              profile_stages=stages('PROFILE_STAGES'),
+              tracemalloc_stages=stages('TRACEMALLOC_STAGES'),
+              profile_dir=os.getenv('PROFILE_DIR', 'logs/profiles'))
+
+
+def enabled():
+    return _state.enabled
+
+
+def count(name, value=1):
+    """Add `value` to a counter, e.g. items processed or bytes read."""
+    if not _state.enabled:
+        return
+    with _state.lock:
+        _state.counters[name] = _state.counters.get(name, 0) + value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS):
+    """Record one value in a histogram."""
+    if not _state.enabled:
+        return
+    with _state.lock:
+        histogram = _state.histograms.get(name)
+        if histogram is None:
+            histogram = _state.histograms[name] = Histogram(buckets)
+        histogram.observe(value)
+
+
+def _write_event(event):
+    if _state.jsonl_file is not None:
+        with _state.lock:
+            _state.jsonl_file.write(json.dumps(event) + '\n')
+
+
+class _Span:
+    def __init__(self, name, items):
+        self.name = name
+        self.items = items
+        self.profiler = None
+        self.tracing = False
+
+    def __enter__(self):
+        if _state.wants(_state.profile_stages, self.name) and not _state.profiling:
+            # Only one cProfile profiler can be active at a time; nested stages are covered by the outer one
+            _state.profiling = True
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if _state.wants(_state.tracemalloc_stages, self.name):
+            self.tracing = not tracemalloc.is_tracing()
+            if self.tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self.start
+        event = {'time': time.time(), 'span': self.name, 'seconds': seconds}
+        if self.items is not None:
+            event['items'] = self.items
+            count(f"{self.name}_items", self.items)
+        if exc_type is not None:
+            event['error'] = exc_type.__name__
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            _state.profiling = False
+            os.makedirs(_state.profile_dir, exist_ok=True)
+            _state.profile_runs += 1
+            profile_path = os.path.join(_state.profile_dir,
+                                        f"{self.name}-{os.getpid()}-{_state.profile_runs}.prof")
+            self.profiler.dump_stats(profile_path)
+            event['profile'] = profile_path
+        if tracemalloc.is_tracing() and _state.wants(_state.tracemalloc_stages, self.name):
+            event['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            observe(f"{self.name}_peak_bytes", event['peak_bytes'],
+                    buckets=tuple(2 ** power for power in range(16, 36, 2)))
+            if self.tracing:
+                tracemalloc.stop()
+
+        observe(f"{self.name}_seconds", seconds)
+        _write_event(event)
+        return False
+
+
+def span(name, items=None):
+    """Context manager timing one run of a stage into the `<name>_seconds` histogram.
+
+    `items` (e.g. the number of emails in the batch) is added to the `<name>_items` counter.
+    While instrumentation is disabled this returns a shared no-op context manager.
+    """
+    if not _state.enabled:
+        return _NULL_SPAN
+    return _Span(name, items)
+
+
+def timed(name):
+    """Decorator running every call of the function inside `span(name)`."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return function(*args, **kwargs)
+            with _Span(name, None):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def prometheus_text():
+    """Render the counters and histograms in the Prometheus text exposition format."""
+    lines = []
+    with _state.lock:
+        for name, value in sorted(_state.counters.items()):
+            metric = f"{METRIC_PREFIX}{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, histogram in sorted(_state.histograms.items()):
+            metric = f"{METRIC_PREFIX}{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines += [f"{metric}_sum {histogram.sum}", f"{metric}_count {histogram.count}"]
+    return '\n'.join(lines) + '\n'
+
+
+def flush():
+    """Write the counter totals to the JSON lines file and rewrite the Prometheus text file."""
+    if not _state.enabled:
+        return
+    if _state.jsonl_file is not None:
+        with _state.lock:
+            counters = dict(_state.counters)
+        _write_event({'time': time.time(), 'counters': counters, 'pid': os.getpid()})
+        _state.jsonl_file.flush()
+    if _state.prometheus_path:
+        temporary_path = f"{_state.prometheus_path}.tmp"
+        os.makedirs(os.path.dirname(_state.prometheus_path) or '.', exist_ok=True)
+        with open(temporary_path, 'w') as f:
+            f.write(prometheus_text())
+        os.replace(temporary_path, _state.prometheus_path)
+
+
+def reset():
+    """Forget every counter and histogram recorded so far."""
+    with _state.lock:
+        _state.counters.clear()
+        _state.histograms.clear()
+
+
+atexit.register(flush)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import sys
+import json
+import click
+import shutil
+import hashlib
+import logging
+import numpy as np
+from itertools import chain
+from datetime import datetime, timezone
+
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src import instrumentation
+from src.data.content_cache import source_version
+from src.features import preprocessing
+from src.features.preprocessing import Preprocessor
+from src.models.prediction import PredictionMixin
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+VOCABULARY_FILE = 'vocabulary.txt'
+# TfidfVectorizer settings the compact scorer reproduces; any other value of these is refused at export
+SUPPORTED_VECTORIZER_PARAMS = {'analyzer': 'word', 'tokenizer': None, 'preprocessor': None, 'stop_words': None,
+                               'strip_accents': None, 'vocabulary': None}
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def feature_config(vectorizer):
+    """The settings of a fitted TfidfVectorizer the compact scorer needs, or a ValueError if it cannot reproduce it."""
+    if not hasattr(vectorizer, 'vocabulary_'):
+        raise ValueError(f"Only the 'tfidf' feature backend can be exported, not {type(vectorizer).__name__}; "
+                         f"hashed features need sklearn's hashing function")
+    params = vectorizer.get_params()
+    for name, supported in SUPPORTED_VECTORIZER_PARAMS.items():
+        if params.get(name) != supported:
+            raise ValueError(f"Cannot export a vectorizer with {name}={params.get(name)!r}")
+    return {
+        'lowercase': params['lowercase'],
+        'token_pattern': params['token_pattern'],
+        'ngram_range': list(params['ngram_range']),
+        'binary': params['binary'],
+        'sublinear_tf': params['sublinear_tf'],
+        'use_idf': params['use_idf'],
+        'norm': params['norm'],
+        'n_features': len(vectorizer.vocabulary_),
+    }
+
+
+def export_compact(classifier, directory):
+    """Write a SpamClassifier with a TF-IDF vectorizer and a MultinomialNB model as a compact artifact directory.
+
+    The vocabulary is a sorted text file, one term per line in column order; the IDF weights and
+    the model's log-probabilities are float32 .npy files that `CompactSpamClassifier` memory-maps.
+    manifest.json records the format version, the feature settings and a SHA-256 of every file.
+    The directory is written next to its destination and then swapped in by `replace_directory`.
+    """
+    model, vectorizer, preprocessor = classifier.model, classifier.vectorizer, classifier.preprocessor
+    if type(model).__name__ != 'MultinomialNB':
+        raise ValueError(f"Only MultinomialNB models can be exported, not {type(model).__name__}")
+    if preprocessor.lemmatizer is not None or preprocessor.stop_words is not None:
+        raise ValueError("Only the default preprocessing (NLTK lemmatizer and stop words) can be exported")
+    config = feature_config(vectorizer)
+
+    # sklearn numbers the vocabulary in sorted term order, so a term's line is its column
+    terms = sorted(vectorizer.vocabulary_)
+    if any(vectorizer.vocabulary_[term] != column for column, term in enumerate(terms)):
+        raise ValueError("The vectorizer's columns are not in sorted term order")
+
+    arrays = {
+        'idf': (vectorizer.idf_ if config['use_idf'] else np.ones(len(terms))).astype(np.float32),
+        # One row per feature, so scoring an email gathers contiguous rows
+        'feature_log_prob': np.ascontiguousarray(model.feature_log_prob_.T, dtype=np.float32),
+        'class_log_prior': model.class_log_prior_.astype(np.float32),
+        'classes': np.asarray(model.classes_),
+    }
+
+    temporary_directory = f"{directory.rstrip(os.sep)}.tmp"
+    shutil.rmtree(temporary_directory, ignore_errors=True)
+    os.makedirs(temporary_directory)
+    with open(os.path.join(temporary_directory, VOCABULARY_FILE), 'w', encoding='utf-8', newline='\n') as f:
+        f.write('\n'.join(terms))
+    for name, array in arrays.items():
+        np.save(os.path.join(temporary_directory, f"{name}.npy"), array)
+
+    files = {name: {'file': f"{name}.npy", 'dtype': array.dtype.str, 'shape': list(array.shape)}
+             for name, array in arrays.items()}
+    files['vocabulary'] = {'file': VOCABULARY_FILE, 'terms': len(terms)}
+    for component in files.values():
+        component['sha256'] = file_sha256(os.path.join(temporary_directory, component['file']))
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'model': type(model).__name__,
+        'feature_config': config,
+        'preprocessing_version': source_version(preprocessing.__file__),
+        # Identifies the artifact as a whole: a digest of every file's digest
+        'checksum': hashlib.sha256(''.join(files[name]['sha256'] for name in sorted(files)).encode()).hexdigest(),
+        'components': files,
+    }
+    with open(os.path.join(temporary_directory, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Imported here so loading a compact artifact still never imports scipy
+    from src.features.feature_store import replace_directory
+    replace_directory(temporary_directory, directory)
+    return manifest
+
+
+class CompactSpamClassifier(PredictionMixin):
+    """Scores emails from a compact artifact written by `export_compact`, without sklearn or scipy.
+
+    Loading reads the manifest and the vocabulary and memory-maps the float32 arrays, so it costs
+    a few milliseconds and no sklearn import. Probabilities match the pickled SpamClassifier's up
+    to float32 rounding. Offers the same predict methods as SpamClassifier.
+    """
+
+    def __init__(self, directory, manifest, vocabulary, arrays, preprocessor=None):
+        self.directory = directory
+        self.manifest = manifest
+        self.vocabulary = vocabulary
+        self.idf = arrays['idf']
+        self.feature_log_prob = arrays['feature_log_prob']
+        self.class_log_prior = arrays['class_log_prior']
+        self.classes_ = np.asarray(arrays['classes'])
+        self.preprocessor = Preprocessor() if preprocessor is None else preprocessor
+
+        config = manifest['feature_config']
+        self.token_re = re.compile(config['token_pattern'])
+        self.lowercase = config['lowercase']
+        self.ngram_range = tuple(config['ngram_range'])
+        self.binary = config['binary']
+        self.sublinear_tf = config['sublinear_tf']
+        self.norm = config['norm']
+
+    @classmethod
+    def load(cls, directory, verify=True, mmap_mode='r'):
+        """Open a compact artifact, checking its format version and, with `verify`, its checksums."""
+        logger.info(f"Loading the compact pipeline from {directory}")
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"{directory} has compact artifact format {manifest.get('format_version')}, "
+                             f"expected {FORMAT_VERSION}; export it again")
+        components = manifest['components']
+        if verify:
+            for component in components.values():
+                if file_sha256(os.path.join(directory, component['file'])) != component['sha256']:
+                    raise ValueError(f"{directory}/{component['file']} does not match its checksum")
+        if manifest['preprocessing_version'] != source_version(preprocessing.__file__):
+            logger.warning(f"The preprocessing code changed since {directory} was exported; "
+                           f"predictions may differ from the ones it was trained for")
+
+        with open(os.path.join(directory, VOCABULARY_FILE), encoding='utf-8') as f:
+            terms = f.read().split('\n')
+        arrays = {name: np.load(os.path.join(directory, component['file']), mmap_mode=mmap_mode)
+                  for name, component in components.items() if name != 'vocabulary'}
+        return cls(directory, manifest, dict(zip(terms, range(len(terms)))), arrays)
+
+    def columns(self, processed_body):
+        """The vocabulary columns of every token and n-gram of a preprocessed body, repeated per occurrence."""
+        tokens = self.token_re.findall(processed_body.lower() if self.lowercase else processed_body)
+        min_n, max_n = self.ngram_range
+        terms = list(tokens) if min_n == 1 else []
+        # Same n-gram order as sklearn's TfidfVectorizer, though only the counts matter here
+        for n in range(max(min_n, 2), max_n + 1):
+            terms += [' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+        vocabulary = self.vocabulary
+        return [vocabulary[term] for term in terms if term in vocabulary]
+
+    def joint_log_likelihood(self, processed_bodies):
+        """Log prior plus log likelihood of each class for each preprocessed body, scored from their TF-IDF vectors.
+
+        The whole batch is weighted and summed in a few vectorized passes over its (row, column) pairs.
+        """
+        n_rows, n_features = len(processed_bodies), len(self.idf)
+        row_columns = [self.columns(body) for body in processed_bodies]
+        keys = (np.repeat(np.arange(n_rows, dtype=np.int64), [len(columns) for columns in row_columns]) * n_features
+                + np.fromiter(chain.from_iterable(row_columns), dtype=np.int64))
+        keys, counts = np.unique(keys, return_counts=True)
+        rows, columns = np.divmod(keys, n_features)
+
+        weights = np.ones(len(counts), dtype=np.float32) if self.binary else counts.astype(np.float32)
+        if self.sublinear_tf:
+            weights = np.log(weights) + 1
+        weights *= self.idf[columns]
+        if self.norm == 'l2':
+            weights /= np.sqrt(np.bincount(rows, weights=weights * weights, minlength=n_rows))[rows].astype(np.float32)
+        elif self.norm == 'l1':
+            weights /= np.bincount(rows, weights=np.abs(weights), minlength=n_rows)[rows].astype(np.float32)
+
+        # Emails without a known term score their class priors alone
+        jll = np.tile(self.class_log_prior.astype(np.float64), (n_rows, 1))
+        feature_log_prob = self.feature_log_prob[columns]
+        for k in range(jll.shape[1]):
+            jll[:, k] += np.bincount(rows, weights=weights * feature_log_prob[:, k], minlength=n_rows)
+        return jll
+
+    def predict_proba_processed(self, processed_bodies):
+        """Return the class probabilities of email bodies already run through `preprocess`."""
+        with instrumentation.span('score', items=len(processed_bodies)):
+            jll = self.joint_log_likelihood(processed_bodies)
+            # Normalize in log space, like MultinomialNB.predict_proba
+            jll -= jll.max(axis=1, keepdims=True)
+            probabilities = np.exp(jll)
+            return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+@click.command()
+@click.argument('pipeline_filepath', type=click.Path(exists=True), default='models/spam_pipeline.pkl')
+@click.argument('output_directory', type=click.Path(), default='models/spam_compact')
+def main(pipeline_filepath, output_directory):
+    """ Exports a pickled SpamClassifier pipeline as a compact, memory-mappable artifact directory. """
+    from src.models.pipeline import SpamClassifier
+
+    classifier = SpamClassifier.load(pipeline_filepath)
+    manifest = export_compact(classifier, output_directory)
+    size = sum(os.path.getsize(os.path.join(output_directory, name)) for name in os.listdir(output_directory))
+    logger.info(f"Exported {pipeline_filepath} ({os.path.getsize(pipeline_filepath) / 1024:.1f} KB) to "
+                f"{output_directory} ({size / 1024:.1f} KB), checksum {manifest['checksum'][:16]}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # Click command handles the arguments
+    main()
@@ -0,0 +1,74 @@
+import os
+import logging
+import joblib
+
+from src import instrumentation
+from src.features.vectorizing import HashingTfidfVectorizer
+from src.models.prediction import PredictionMixin
+
+logger = logging.getLogger(__name__)
+
+
+class SpamClassifier(PredictionMixin):
+    """Preprocessing, vectorizer and model, saved by training and loaded by inference as one artifact.
+
+    Serving runs exactly the preprocessing that produced the training vectors, and the
+    predict methods only do the scoring math once the artifact is loaded.
+    """
+
+    def __init__(self, preprocessor, vectorizer, model):
+        self.preprocessor = preprocessor
+        self.vectorizer = vectorizer
+        self.model = model
+
+    @classmethod
+    def load(cls, pipeline_filepath):
+        """Load a pipeline artifact saved with `save`."""
+        logger.info(f"Loading the trained pipeline from {pipeline_filepath}")
+        classifier = joblib.load(pipeline_filepath)
+        if not isinstance(classifier, cls):
+            raise TypeError(f"{pipeline_filepath} does not contain a {cls.__name__}")
+        return classifier
+
+    def save(self, pipeline_filepath):
+        """Save preprocessing, vectorizer and model together.
+
+        The artifact is written next to its destination and then renamed over it, so a
+        process reloading it never sees a half-written file.
+        """
+        temporary_filepath = f"{pipeline_filepath}.tmp"
+        joblib.dump(self, temporary_filepath)
+        os.replace(temporary_filepath, pipeline_filepath)
+
+    def transform(self, email_bodies):
+        """Preprocess and vectorize a list of raw email bodies into one sparse matrix."""
+        processed_bodies = self.preprocess(email_bodies)
+        with instrumentation.span('vectorize', items=len(email_bodies)):
+            return self.vectorizer.transform(processed_bodies)
+
+    @property
+    def supports_partial_fit(self):
+        """Whether new emails can be folded in without refitting, i.e. a hashed feature space."""
+        return isinstance(self.vectorizer, HashingTfidfVectorizer) and hasattr(self.model, 'partial_fit')
+
+    def partial_fit(self, email_bodies, labels, classes=(0, 1)):
+        """Update the model's statistics with a mini-batch of labelled raw email bodies.
+
+        The IDF weights are kept as fitted; only the model's counts are updated.
+        """
+        if not self.supports_partial_fit:
+            raise ValueError("Incremental updates need the 'hashing' feature backend and a model with partial_fit; "
+                             "rebuild the features with FEATURE_BACKEND=hashing and retrain")
+        self.model.partial_fit(self.transform(email_bodies), labels, classes=list(classes))
+        return self
+
+    @property
+    def classes_(self):
+        return self.model.classes_
+
+    def predict_proba_processed(self, processed_bodies):
+        """Return the class probabilities of email bodies already run through `preprocess`."""
+        with instrumentation.span('vectorize', items=len(processed_bodies)):
+            X = self.vectorizer.transform(processed_bodies)
+        with instrumentation.span('score', items=len(processed_bodies)):
+            return self.model.predict_proba(X)
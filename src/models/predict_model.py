@@ -1,47 +1,76 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
-import joblib
 import logging
+import threading
 from dotenv import load_dotenv, find_dotenv
 
 # Add the root directory to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from src.features.preprocessing import preprocess_email_body
+from src.models.compact_artifact import CompactSpamClassifier
+from src.models.verdict_cache import NearDuplicateVerdictCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def predict_email_class(email_body, vectorizer_filepath, model_filepath):
+
+# Process-wide registry of loaded classifiers, keyed by artifact path
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def load_classifier(pipeline_filepath):
+    """Load a compact artifact directory, or a pickled SpamClassifier.
+
+    With VERDICT_CACHE_SIZE set, near-duplicates of that many recently scored emails reuse their verdicts.
+    """
+    if os.path.isdir(pipeline_filepath):
+        classifier = CompactSpamClassifier.load(pipeline_filepath)
+    else:
+        # Imported here as it imports sklearn, which a compact artifact does without
+        from src.models.pipeline import SpamClassifier
+        classifier = SpamClassifier.load(pipeline_filepath)
+
+    verdict_cache_size = int(os.getenv('VERDICT_CACHE_SIZE') or 0)
+    if verdict_cache_size > 0:
+        threshold = float(os.getenv('NEAR_DUPLICATE_THRESHOLD') or 0.8)
+        classifier = NearDuplicateVerdictCache(classifier, verdict_cache_size, threshold)
+    return classifier
+
+
+def get_classifier(pipeline_filepath):
+    """Return a warm classifier for the given pipeline artifact, reloading it if the file changed."""
+    key = os.path.abspath(pipeline_filepath)
+    mtime = os.path.getmtime(pipeline_filepath)
+
+    with _classifiers_lock:
+        cached = _classifiers.get(key)
+        if cached is None or cached[0] != mtime:
+            classifier = load_classifier(pipeline_filepath)
+            _classifiers[key] = (mtime, classifier)
+            return classifier
+        return cached[1]
+
+
+def clear_classifiers():
+    """Drop every cached classifier so the next call reloads from disk."""
+    with _classifiers_lock:
+        _classifiers.clear()
+
+
+def predict_email_class(email_body, pipeline_filepath):
     """Preprocess, vectorize, and predict the class of a single email (spam or ham), including confidence score."""
-    
-    # Preprocess the email body
-    logger.info("Preprocessing the input email body")
-    processed_email_body = email_body.lower()  # Example preprocessing step
-
-    # Load the trained vectorizer
-    logger.info("Loading the trained vectorizer")
-    vectorizer = joblib.load(vectorizer_filepath)
-    
-    # Vectorize the processed email body
-    logger.info("Vectorizing the email")
-    vectorized_email = vectorizer.transform([processed_email_body])
-    
-    # Load the trained model
-    logger.info("Loading the trained model")
-    model = joblib.load(model_filepath)
-    
-    # Make prediction and get the probabilities
-    logger.info("Making prediction on the input email")
-    prediction = model.predict(vectorized_email)
-    prediction_proba = model.predict_proba(vectorized_email)
-
-    # Extract the probability of the predicted class
-    predicted_class = prediction[0]
-    confidence = prediction_proba[0][predicted_class]  # Probability of the predicted class
-
-    # Interpret prediction and return confidence
-    label = "Spam" if predicted_class == 1 else "Ham"
-    return label, confidence
\ No newline at end of file
+    classifier = get_classifier(pipeline_filepath)
+
+    logger.debug("Making prediction on the input email")
+    return classifier.predict(email_body)
+
+
+def predict_batch(email_bodies, pipeline_filepath):
+    """Preprocess, vectorize, and predict the class of a list of emails, including confidence scores."""
+    classifier = get_classifier(pipeline_filepath)
+
+    logger.debug(f"Making predictions on {len(email_bodies)} input emails")
+    return classifier.predict_batch(list(email_bodies))
@@ -0,0 +1,39 @@
+import numpy as np
+
+from src import instrumentation
+
+
+class PredictionMixin:
+    """The predict methods shared by the classifiers, built on their `predict_proba_processed`.
+
+    Classes using it provide `predict_proba_processed`, `classes_` and a `preprocessor`, or
+    override `preprocess`. Kept free of sklearn so the compact classifier can use it too.
+    """
+
+    def preprocess(self, email_bodies):
+        with instrumentation.span('preprocess', items=len(email_bodies)):
+            return [self.preprocessor(email_body) for email_body in email_bodies]
+
+    def predict_proba_batch(self, email_bodies):
+        """Return the class probabilities of a list of email bodies, one row per email."""
+        return self.predict_proba_processed(self.preprocess(email_bodies))
+
+    def predict_batch(self, email_bodies):
+        """Return a (label, confidence) pair for each email body, scored in a single pass."""
+        if not email_bodies:
+            return []
+        prediction_proba = self.predict_proba_batch(email_bodies)
+
+        # The predicted class of each row is its most probable one
+        best = prediction_proba.argmax(axis=1)
+        confidences = prediction_proba[np.arange(len(best)), best]
+        labels = np.where(self.classes_[best] == 1, "Spam", "Ham")
+        return list(zip(labels.tolist(), confidences.tolist()))
+
+    def predict_proba(self, email_body):
+        """Return the class probabilities of a single email body."""
+        return self.predict_proba_batch([email_body])[0]
+
+    def predict(self, email_body):
+        """Return the label ('Spam' or 'Ham') and confidence score of a single email body."""
+        return self.predict_batch([email_body])[0]
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import csv
+import json
+import time
+import click
+import mailbox
+import logging
+from collections import deque
+from functools import partial
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv, find_dotenv
+
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src import instrumentation
+from src.data.content_cache import source_version
+from src.data.parse_email import cache_version, parse_email_bytes
+from src.models.compact_artifact import MANIFEST_FILE
+from src.models.predict_model import get_classifier
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+RESULT_FIELDS = ['Filename', 'Label', 'Confidence']
+OUTPUT_FORMATS = ('csv', 'jsonl')
+
+
+def read_file(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+def iter_directory(directory):
+    """Yield (name, read) for every file under a maildir or plain directory of emails, in sorted order.
+
+    In a maildir only `cur` and `new` are read; `tmp` holds messages still being delivered.
+    Hidden files and directories (including Maildir++ subfolders) are skipped.
+    """
+    for root, directories, filenames in os.walk(directory):
+        if {'cur', 'new'} <= set(directories):
+            directories[:] = ['cur', 'new']
+        directories[:] = sorted(name for name in directories if not name.startswith('.'))
+        for filename in sorted(filenames):
+            if not filename.startswith('.'):
+                file_path = os.path.join(root, filename)
+                yield os.path.relpath(file_path, directory), partial(read_file, file_path)
+
+
+def iter_mbox(mbox_path):
+    """Yield (name, read) for every message of an mbox file, in file order, named '<mbox file>:<index>'."""
+    mbox = mailbox.mbox(mbox_path, create=False)
+    basename = os.path.basename(mbox_path)
+    for index, key in enumerate(mbox.iterkeys()):
+        yield f"{basename}:{index}", partial(mbox.get_bytes, key)
+
+
+def iter_messages(input_path):
+    """Yield (name, read) for every message of a maildir / directory or an mbox file; read() returns its raw bytes."""
+    if os.path.isdir(input_path):
+        return iter_directory(input_path)
+    return iter_mbox(input_path)
+
+
+def score_batch(pipeline_filepath, batch):
+    """Parse and score a batch of (name, raw bytes), returning one result row per message, in order.
+
+    Runs in the worker processes, each of which loads the classifier once and keeps it warm.
+    Messages that cannot be parsed get no label or confidence.
+    """
+    classifier = get_classifier(pipeline_filepath)
+    records = [parse_email_bytes(raw_bytes, name, None) for name, raw_bytes in batch]
+    parsed = [i for i, record in enumerate(records) if record is not None]
+    predictions = classifier.predict_batch([records[i]['Body'] or '' for i in parsed])
+
+    rows = [{'Filename': name, 'Label': None, 'Confidence': None} for name, _ in batch]
+    for i, (label, confidence) in zip(parsed, predictions):
+        rows[i]['Label'] = label
+        rows[i]['Confidence'] = round(confidence, 6)
+    return rows
+
+
+def scored_batches(batches, pipeline_filepath, workers):
+    """Yield the result rows of each batch in input order, scoring up to two batches per worker ahead."""
+    if workers == 1:
+        for batch in batches:
+            yield score_batch(pipeline_filepath, batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=get_classifier,
+                             initargs=(pipeline_filepath,)) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(score_batch, pipeline_filepath, batch))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def artifact_version(pipeline_filepath):
+    """Version of a pipeline pickle or compact artifact; changes whenever it is retrained."""
+    if os.path.isdir(pipeline_filepath):
+        return source_version(os.path.join(pipeline_filepath, MANIFEST_FILE))
+    return source_version(pipeline_filepath)
+
+
+def load_checkpoint(checkpoint_path, config):
+    """Return the saved sweep state, or None if there is none for this input, model and output."""
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        state = json.load(f)
+    if state['config'] != config:
+        logger.info(f"Ignoring the checkpoint {checkpoint_path}: it was made with another model or settings")
+        return None
+    return state
+
+
+def save_checkpoint(checkpoint_path, state):
+    with open(f"{checkpoint_path}.tmp", 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+
+def skip_scored(messages, state):
+    """Skip the messages a resumed sweep already scored; False if the input no longer starts with them."""
+    if not state['messages_done']:
+        return True
+    scored = list(islice(messages, state['messages_done'] - 1, state['messages_done']))
+    return bool(scored) and scored[0][0] == state['last_message']
+
+
+def open_output(output_path, output_format, offset=None):
+    """Open the results file, truncated back to `offset` when resuming; returns (file, write rows function)."""
+    if offset is None:
+        output_file = open(output_path, mode='w', newline='', encoding='utf-8')
+    else:
+        output_file = open(output_path, mode='r+', newline='', encoding='utf-8')
+        output_file.truncate(offset)
+        output_file.seek(offset)
+
+    if output_format == 'csv':
+        writer = csv.DictWriter(output_file, fieldnames=RESULT_FIELDS)
+        if offset is None:
+            writer.writeheader()
+        return output_file, writer.writerows
+    return output_file, lambda rows: output_file.writelines(json.dumps(row) + '\n' for row in rows)
+
+
+def score_mailbox(input_path, output_path, pipeline_filepath, output_format='csv', workers=1, batch_size=256,
+                  checkpoint=True):
+    """ Score every message of a maildir, directory or mbox, streaming (filename, label, confidence) rows
+        to `output_path` in input order.
+
+        With `checkpoint`, progress is saved to `<output_path>.checkpoint.json` after each batch, and a
+        sweep of the same input with the same model resumes from there. The input must not change
+        in between; if its first messages differ from the scored ones, the sweep starts over.
+    """
+    checkpoint_path = f"{output_path}.checkpoint.json"
+    config = {'input_path': os.path.abspath(input_path), 'output_format': output_format,
+              'model': artifact_version(pipeline_filepath), 'parser': cache_version()}
+    state = load_checkpoint(checkpoint_path, config) if checkpoint else None
+
+    messages = iter_messages(input_path)
+    if state is not None and not skip_scored(messages, state):
+        logger.info(f"Ignoring the checkpoint {checkpoint_path}: the input changed since it was made")
+        messages, state = iter_messages(input_path), None
+    if state is None:
+        state = {'config': config, 'messages_done': 0, 'last_message': None, 'output_offset': None}
+    else:
+        logger.info(f"Resuming after {state['messages_done']} scored messages")
+
+    def batches():
+        while True:
+            batch = [(name, read()) for name, read in islice(messages, batch_size)]
+            if not batch:
+                return
+            yield batch
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    output_file, write_rows = open_output(output_path, output_format, state['output_offset'])
+    start, scored = time.perf_counter(), 0
+    try:
+        for rows in scored_batches(batches(), pipeline_filepath, workers):
+            write_rows(rows)
+            scored += len(rows)
+            state['messages_done'] += len(rows)
+            state['last_message'] = rows[-1]['Filename']
+            instrumentation.count('messages_scored', len(rows))
+
+            if checkpoint:
+                output_file.flush()
+                os.fsync(output_file.fileno())
+                state['output_offset'] = output_file.tell()
+                save_checkpoint(checkpoint_path, state)
+            if scored % (batch_size * 40) < len(rows):
+                logger.info(f"Scored {state['messages_done']} messages "
+                            f"({scored / (time.perf_counter() - start):.0f} messages/s)")
+    finally:
+        output_file.close()
+
+    # The sweep is complete, so a new one starts from the beginning
+    if checkpoint and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    logger.info(f"Scored {state['messages_done']} messages into {output_path}")
+    return state['messages_done']
+
+
+@click.command()
+@click.argument('input_path', default='data/raw/test', type=click.Path(exists=True))
+@click.argument('output_path', default='reports/predictions.csv', type=click.Path())
+@click.option('--format', 'output_format', type=click.Choice(OUTPUT_FORMATS),
+              help='Output format; by default inferred from the output extension (.jsonl or else csv).')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, type=click.IntRange(min=1),
+              help='Number of processes parsing and scoring, each loading the model once.')
+@click.option('--batch-size', default=256, show_default=True, type=click.IntRange(min=1),
+              help='Number of messages sent to a worker at a time, and scored together.')
+@click.option('--no-checkpoint', is_flag=True, help='Do not save progress after each batch, nor resume from it.')
+def main(input_path, output_path, output_format, workers, batch_size, no_checkpoint):
+    """ Scores every email of a maildir, a directory of raw emails or an mbox file (INPUT_PATH),
+        writing each one's filename, label and confidence to OUTPUT_PATH in input order.
+    """
+    pipeline_filepath = os.getenv('PREDICTION_PIPELINE', 'models/spam_pipeline.pkl')
+    if output_format is None:
+        output_format = 'jsonl' if output_path.endswith('.jsonl') else 'csv'
+
+    score_mailbox(input_path, output_path, pipeline_filepath, output_format, workers, batch_size, not no_checkpoint)
+
+
+if __name__ == '__main__':
+    load_dotenv(find_dotenv())
+    instrumentation.configure_from_env()
+
+    # Click command handles the arguments
+    main()
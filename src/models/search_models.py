@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import sys
+import json
+import time
+import click
+import joblib
+import pickle
+import shutil
+import logging
+import statistics
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from dotenv import load_dotenv, find_dotenv
+from sklearn.naive_bayes import MultinomialNB, ComplementNB
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import StratifiedKFold, StratifiedGroupKFold
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src import instrumentation
+from src.data.content_cache import ContentCache, content_hash, source_version
+from src.features import preprocessing
+from src.features.preprocessing import preprocess_many, preprocess_with_cache
+from src.features.feature_store import open_feature_set, save_feature_set
+from src.features.near_duplicates import deduplicate
+from src.features.over_sampling import REBALANCE_STRATEGIES, rebalance
+from src.features.train_test_split import train_data_split
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Candidate models and the values of their `alpha` (smoothing for NB, regularization for the linear models).
+# Every model has predict_proba, which SpamClassifier needs to serve it.
+MODELS = {
+    'multinomial_nb': (MultinomialNB, (0.01, 0.1, 1.0)),
+    'complement_nb': (ComplementNB, (0.01, 0.1, 1.0)),
+    'logistic': (lambda alpha: SGDClassifier(loss='log_loss', alpha=alpha, random_state=42), (1e-6, 1e-5, 1e-4)),
+    'linear_svm': (lambda alpha: SGDClassifier(loss='modified_huber', alpha=alpha, random_state=42),
+                   (1e-6, 1e-5, 1e-4)),
+}
+
+
+def parse_int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def parse_ngram_ranges(value):
+    """Parse '1-1,1-2' into [(1, 1), (1, 2)]."""
+    return [tuple(int(n) for n in item.split('-')) for item in value.split(',')]
+
+
+def build_fold(bodies, labels, train_index, validation_index, max_features, ngram_range, fold_directory):
+    """Fit a vectorizer on one training fold and save both transformed folds as feature sets.
+
+    The folds are cached: with the same data and settings, later searches (and every model
+    evaluated on the fold) reuse them, memory-mapped, instead of transforming again. See
+    `fold_cache_directory` for when they are invalidated.
+    """
+    if os.path.exists(os.path.join(fold_directory, 'vectorizer.pkl')):
+        return fold_directory
+
+    vectorizer = TfidfVectorizer(max_features=max_features, ngram_range=ngram_range)
+    with instrumentation.span('vectorize', items=len(bodies)):
+        X_train = vectorizer.fit_transform([bodies[i] for i in train_index])
+        X_validation = vectorizer.transform([bodies[i] for i in validation_index])
+    save_feature_set(os.path.join(fold_directory, 'train'), X_train, labels[train_index])
+    save_feature_set(os.path.join(fold_directory, 'validation'), X_validation, labels[validation_index])
+    # Written last: its presence marks the fold as complete
+    joblib.dump(vectorizer, os.path.join(fold_directory, 'vectorizer.pkl'))
+    return fold_directory
+
+
+def make_model(name, alpha):
+    factory, _ = MODELS[name]
+    return factory(alpha=alpha)
+
+
+def evaluate_fold(fold_directory, candidates, rebalance_strategy):
+    """Fit and score every (model, alpha) candidate on one cached fold."""
+    train_set = open_feature_set(os.path.join(fold_directory, 'train'))
+    validation_set = open_feature_set(os.path.join(fold_directory, 'validation'))
+    X_train, y_train, sample_weight = rebalance(train_set.X, train_set.y, rebalance_strategy)
+
+    scores = {}
+    for name, alpha in candidates:
+        model = make_model(name, alpha)
+        start = time.perf_counter()
+        model.fit(X_train, y_train, sample_weight=sample_weight)
+        fit_seconds = time.perf_counter() - start
+        accuracy = accuracy_score(validation_set.y, model.predict(validation_set.X))
+        scores[(name, alpha)] = (accuracy, fit_seconds)
+    return scores
+
+
+def measure_serving(fold_directory, candidates, sample_bodies, rebalance_strategy):
+    """Per-email predict latency (vectorize + predict_proba) and pickled size of each candidate."""
+    vectorizer = joblib.load(os.path.join(fold_directory, 'vectorizer.pkl'))
+    vectorizer_bytes = len(pickle.dumps(vectorizer, protocol=pickle.HIGHEST_PROTOCOL))
+    train_set = open_feature_set(os.path.join(fold_directory, 'train'))
+    X_train, y_train, sample_weight = rebalance(train_set.X, train_set.y, rebalance_strategy)
+
+    results = {}
+    for name, alpha in candidates:
+        model = make_model(name, alpha).fit(X_train, y_train, sample_weight=sample_weight)
+        latencies = []
+        for body in sample_bodies:
+            start = time.perf_counter()
+            model.predict_proba(vectorizer.transform([body]))
+            latencies.append((time.perf_counter() - start) * 1000)
+        model_bytes = len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+        results[(name, alpha)] = (statistics.median(latencies), vectorizer_bytes + model_bytes)
+    return results
+
+
+def load_training_bodies(input_filepath, cache_filepath, near_duplicates='group', near_duplicate_threshold=0.8):
+    """Preprocessed bodies, labels and near-duplicate groups (or None) of the training split build_features makes.
+
+    The test split is left out.
+    """
+    df = pd.read_csv(input_filepath)
+    bodies = df['Body'].fillna('').tolist()
+    if cache_filepath:
+        with ContentCache(cache_filepath, 'preprocessed_bodies', source_version(preprocessing.__file__)) as cache:
+            processed_bodies = preprocess_with_cache(bodies, cache)
+    else:
+        processed_bodies = preprocess_many(bodies)
+
+    keep, groups = deduplicate(processed_bodies, near_duplicates, near_duplicate_threshold)
+    labels = np.array(df['Label'])[keep]
+    # Split the positions, so the groups can be selected along with the bodies and labels
+    train_index, _, train_labels, _ = train_data_split(np.arange(len(keep)), labels, groups=groups)
+    train_bodies = [processed_bodies[keep[i]] for i in train_index]
+    return train_bodies, train_labels, None if groups is None else groups[train_index]
+
+
+def fold_cache_directory(cache_directory, bodies, labels, groups, folds):
+    """The directory caching the folds of this training split, removing those of any other split.
+
+    Folds depend on the training data (bodies, labels and near-duplicate groups), the number of
+    folds and the code that builds them, all hashed into the directory name. When any of them
+    changes, the folds cached for the previous version are stale and are deleted, so the cache
+    only ever holds the folds of one training split (one per vectorizer setting and fold).
+    """
+    data_version = content_hash(json.dumps([bodies, labels.tolist(), None if groups is None else groups.tolist(),
+                                            folds, source_version(__file__)]))[:16]
+    if os.path.isdir(cache_directory):
+        for entry in os.listdir(cache_directory):
+            entry_path = os.path.join(cache_directory, entry)
+            # Only directories named like a version are removed, in case the cache shares its directory
+            if entry != data_version and os.path.isdir(entry_path) and re.fullmatch(r'[0-9a-f]{16}', entry):
+                logger.info(f"Removing stale cached folds {entry_path}")
+                shutil.rmtree(entry_path, ignore_errors=True)
+    return os.path.join(cache_directory, data_version)
+
+
+def search(bodies, labels, max_features_values, ngram_ranges, model_names, folds, n_jobs, cache_directory,
+           rebalance_strategy, groups=None, latency_samples=200):
+    """Cross-validate every combination of vectorizer settings, model and alpha; return one row per combination.
+
+    With `groups`, near-duplicates are kept in the same fold.
+    """
+    candidates = [(name, alpha) for name in model_names for alpha in MODELS[name][1]]
+    vectorizer_settings = [(max_features, ngram_range) for max_features in max_features_values
+                           for ngram_range in ngram_ranges]
+    if groups is None:
+        splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=42).split(bodies, labels))
+    else:
+        splits = list(StratifiedGroupKFold(n_splits=folds, shuffle=True, random_state=42).split(bodies, labels, groups))
+
+    version_directory = fold_cache_directory(cache_directory, bodies, labels, groups, folds)
+    fold_directories = {
+        (setting, fold): os.path.join(version_directory, content_hash(f"{setting}-{fold}")[:16])
+        for setting in vectorizer_settings for fold in range(folds)
+    }
+
+    logger.info(f"Building {len(fold_directories)} vectorized folds ({len(vectorizer_settings)} vectorizer settings "
+                f"x {folds} folds) with {n_jobs} job(s)")
+    Parallel(n_jobs=n_jobs)(
+        delayed(build_fold)(bodies, labels, *splits[fold], *setting, directory)
+        for (setting, fold), directory in fold_directories.items())
+
+    logger.info(f"Evaluating {len(candidates)} model candidates on every fold")
+    fold_scores = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_fold)(directory, candidates, rebalance_strategy) for directory in fold_directories.values())
+    fold_scores = dict(zip(fold_directories, fold_scores))
+
+    # Latency is measured sequentially, so parallel jobs do not skew it
+    logger.info(f"Measuring the serving latency and artifact size of each combination")
+    sample_bodies = bodies[:latency_samples]
+    rows = []
+    for setting in vectorizer_settings:
+        serving = measure_serving(fold_directories[(setting, 0)], candidates, sample_bodies, rebalance_strategy)
+        for candidate in candidates:
+            accuracies = [fold_scores[(setting, fold)][candidate][0] for fold in range(folds)]
+            fit_seconds = [fold_scores[(setting, fold)][candidate][1] for fold in range(folds)]
+            latency_ms, artifact_bytes = serving[candidate]
+            rows.append({
+                'max_features': setting[0],
+                'ngram_range': f"{setting[1][0]}-{setting[1][1]}",
+                'model': candidate[0],
+                'alpha': candidate[1],
+                'accuracy_mean': np.mean(accuracies),
+                'accuracy_std': np.std(accuracies),
+                'fit_seconds': np.mean(fit_seconds),
+                'predict_latency_ms': latency_ms,
+                'artifact_kb': artifact_bytes / 1024,
+            })
+    return pd.DataFrame(rows).sort_values('accuracy_mean', ascending=False, ignore_index=True)
+
+
+@click.command()
+@click.option('--models', 'model_names', default=','.join(MODELS), show_default=True,
+              help='Comma-separated models to search.')
+@click.option('--max-features', default='2000,5000,20000', show_default=True, help='Vocabulary sizes to search.')
+@click.option('--ngram-ranges', default='1-1,1-2', show_default=True, help='N-gram ranges to search, as min-max.')
+@click.option('--folds', default=5, show_default=True, type=click.IntRange(min=2))
+@click.option('--jobs', default=-1, show_default=True, help='Parallel jobs (-1 for every core).')
+@click.option('--latency-budget-ms', default=None, type=float,
+              help='Recommend the most accurate combination predicting within this latency.')
+@click.option('--output', default='reports/model_search.csv', show_default=True, type=click.Path())
+@click.option('--cache-dir', default='data/interim/model_search', show_default=True, type=click.Path(),
+              help='Where vectorized folds are cached between searches. Folds are keyed by a hash of the '
+                   'training split, so they are rebuilt, and the stale ones deleted, when the data changes.')
+def main(model_names, max_features, ngram_ranges, folds, jobs, latency_budget_ms, output, cache_dir):
+    """ Cross-validates classifiers, vocabulary sizes, n-gram ranges and alpha values on the training
+        split in parallel, recording accuracy, fit time, predict latency and artifact size.
+    """
+    model_names = model_names.split(',')
+    unknown = set(model_names) - set(MODELS)
+    if unknown:
+        raise click.BadParameter(f"Unknown models {sorted(unknown)}, expected some of {list(MODELS)}")
+
+    input_filepath = os.getenv('INPUT_FILE', 'data/interim/parsed_emails.csv')
+    cache_filepath = os.getenv('CACHE_FILE', 'data/interim/email_cache.sqlite')
+    rebalance_strategy = os.getenv('REBALANCE_STRATEGY', 'smote')
+    if rebalance_strategy not in REBALANCE_STRATEGIES:
+        raise click.BadParameter(f"REBALANCE_STRATEGY must be one of {REBALANCE_STRATEGIES}")
+
+    near_duplicates = os.getenv('NEAR_DUPLICATES', 'group')
+    near_duplicate_threshold = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.8'))
+
+    bodies, labels, groups = load_training_bodies(input_filepath, cache_filepath, near_duplicates,
+                                                  near_duplicate_threshold)
+    results = search(bodies, labels, parse_int_list(max_features), parse_ngram_ranges(ngram_ranges), model_names,
+                     folds, jobs, cache_dir, rebalance_strategy, groups)
+
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    results.to_csv(output, index=False)
+    logger.info(f"Saved {len(results)} results to {output}")
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(results.head(15).to_string(float_format=lambda value: f"{value:.4g}"))
+
+    if latency_budget_ms is not None:
+        within_budget = results[results['predict_latency_ms'] <= latency_budget_ms]
+        if within_budget.empty:
+            print(f"\nNo combination predicts within {latency_budget_ms} ms")
+        else:
+            best = within_budget.iloc[0]
+            print(f"\nMost accurate within {latency_budget_ms} ms: {best['model']} (alpha {best['alpha']}), "
+                  f"max_features {best['max_features']}, ngram_range {best['ngram_range']}: "
+                  f"accuracy {best['accuracy_mean']:.4f}, {best['predict_latency_ms']:.3f} ms")
+
+
+if __name__ == '__main__':
+    load_dotenv(find_dotenv())
+    instrumentation.configure_from_env()
+
+    # Click command handles the arguments
+    main()
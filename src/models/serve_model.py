@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import click
+import asyncio
+import logging
+from dotenv import load_dotenv, find_dotenv
+
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src import instrumentation
+from src.models.predict_model import get_classifier
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class Overloaded(Exception):
+    """Raised when the request queue is full and the request should be retried later."""
+
+
+class MicroBatcher:
+    """Coalesces concurrent prediction requests into batches scored with a single predict_batch call.
+
+    A batch is sent as soon as it holds `max_batch_size` emails, or `max_wait` seconds after its
+    first email arrived. At most `max_queue` emails may wait; beyond that `submit` raises
+    Overloaded so callers shed load instead of queueing without bound.
+    """
+
+    def __init__(self, pipeline_filepath, max_batch_size=64, max_wait=0.005, max_queue=1024):
+        self.pipeline_filepath = pipeline_filepath
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self._worker = None
+
+    def start(self):
+        # Load the model before accepting requests so the first ones do not pay for it
+        get_classifier(self.pipeline_filepath)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+
+    async def submit(self, email_body):
+        """Queue one email body and wait for its (label, confidence)."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((email_body, future))
+        except asyncio.QueueFull:
+            raise Overloaded()
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _score(self, bodies):
+        return get_classifier(self.pipeline_filepath).predict_batch(bodies)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            bodies = [email_body for email_body, _ in batch]
+            try:
+                # Scoring, and reloading the model when the artifact changed on disk, run in a thread
+                # so the event loop keeps accepting requests and answering /health meanwhile
+                results = await loop.run_in_executor(None, self._score, bodies)
+            except Exception as e:
+                logger.exception("Scoring a batch failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            logger.debug(f"Scored a batch of {len(batch)} emails")
+            instrumentation.observe('batch_size', len(batch), buckets=BATCH_SIZE_BUCKETS)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+async def read_request(reader):
+    """Read one HTTP/1.1 request; return (method, path, headers, body) or None at end of stream."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise ValueError('Request body too large')
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+def write_response(writer, status, payload, keep_alive):
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error',
+               503: 'Service Unavailable'}
+    content = json.dumps(payload).encode('utf-8')
+    head = (f"HTTP/1.1 {status} {reasons[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(content)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n")
+    if status == 503:
+        head += "Retry-After: 1\r\n"
+    writer.write(head.encode('latin-1') + b"\r\n" + content)
+
+
+async def handle_request(batcher, method, path, body):
+    """Route one request and return (status, payload)."""
+    if method == 'GET' and path == '/health':
+        return 200, {'status': 'ok', 'queued': batcher.queue.qsize()}
+    if method != 'POST' or path != '/predict':
+        return 404, {'error': 'Use POST /predict with a JSON body like {"body": "..."}'}
+
+    try:
+        email_body = json.loads(body)['body']
+        if not isinstance(email_body, str):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return 400, {'error': 'Expected a JSON object with a string "body"'}
+
+    try:
+        label, confidence = await batcher.submit(email_body)
+    except Overloaded:
+        return 503, {'error': 'Server overloaded, retry later'}
+    except Exception as e:
+        return 500, {'error': str(e)}
+    return 200, {'label': label, 'confidence': confidence}
+
+
+async def serve_connection(batcher, reader, writer):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except (ValueError, asyncio.IncompleteReadError):
+                write_response(writer, 400, {'error': 'Malformed request'}, keep_alive=False)
+                break
+            if request is None:
+                break
+
+            method, path, headers, body = request
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            status, payload = await handle_request(batcher, method, path, body)
+            write_response(writer, status, payload, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(pipeline_filepath, host, port, max_batch_size, max_wait_ms, max_queue):
+    batcher = MicroBatcher(pipeline_filepath, max_batch_size, max_wait_ms / 1000, max_queue)
+    batcher.start()
+
+    server = await asyncio.start_server(lambda r, w: serve_connection(batcher, r, w), host, port)
+    logger.info(f"Serving predictions on http://{host}:{port}/predict "
+                f"(max batch {max_batch_size}, max wait {max_wait_ms} ms, max queue {max_queue})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8000, show_default=True, type=int)
+@click.option('--max-batch-size', default=64, show_default=True, type=click.IntRange(min=1),
+              help='Largest number of requests scored together.')
+@click.option('--max-wait-ms', default=5.0, show_default=True, type=click.FloatRange(min=0),
+              help='How long the first request of a batch waits for others to join it.')
+@click.option('--max-queue', default=1024, show_default=True, type=click.IntRange(min=1),
+              help='Requests allowed to wait for scoring before new ones get a 503.')
+def main(host, port, max_batch_size, max_wait_ms, max_queue):
+    """ Runs a local HTTP server scoring emails with the trained pipeline, micro-batching concurrent requests. """
+    pipeline_filepath = os.getenv('PREDICTION_PIPELINE', 'models/spam_pipeline.pkl')
+    try:
+        asyncio.run(serve(pipeline_filepath, host, port, max_batch_size, max_wait_ms, max_queue))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    load_dotenv(find_dotenv())
+    instrumentation.configure_from_env()
+
+    # Click command handles the arguments
+    main()
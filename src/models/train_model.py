@@ -2,10 +2,24 @@
 import logging
 import joblib
 import os
+import sys
+import shutil
+import numpy as np
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.metrics import accuracy_score, classification_report
 from dotenv import load_dotenv, find_dotenv
 
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.features.preprocessing import Preprocessor
+from src.features.vectorizing import matrix_memory
+from src import instrumentation
+from src.features.feature_store import open_feature_set
+from src.features.over_sampling import rebalance
+from src.models.pipeline import SpamClassifier
+from src.models.compact_artifact import export_compact
+
 # Configure logging
 log_file = "logs/model_training.log"  # Log file to store logs
 os.makedirs(os.path.dirname(log_file), exist_ok=True)
@@ -28,44 +42,95 @@ def evaluate_model(model, X_test, y_test):
     report = classification_report(y_test, y_pred)
     return accuracy, report
 
-def train_naive_bayes(X_train, y_train, X_test, y_test):
-    """Train a Naive Bayes model and evaluate its performance."""
+def evaluate_feature_set(model, feature_set, chunk_size=10_000):
+    """Evaluate the model on a feature set, predicting one chunk of rows at a time."""
+    y_true, y_pred = [], []
+    for X, y in feature_set.iter_chunks(chunk_size):
+        y_true.append(y)
+        y_pred.append(model.predict(X))
+    y_true, y_pred = np.concatenate(y_true), np.concatenate(y_pred)
+    return accuracy_score(y_true, y_pred), classification_report(y_true, y_pred)
+
+def train_naive_bayes(X_train, y_train, test_set, sample_weight=None):
+    """Train a Naive Bayes model, optionally with per-row weights, and evaluate it on a feature set."""
     logger.info(f"Training Naive Bayes...")
     model = MultinomialNB()
-    model.fit(X_train, y_train)
+    with instrumentation.span('train', items=X_train.shape[0]):
+        model.fit(X_train, y_train, sample_weight=sample_weight)
     
     # Evaluate the model
-    accuracy, report = evaluate_model(model, X_test, y_test)
+    with instrumentation.span('evaluate', items=len(test_set)):
+        accuracy, report = evaluate_feature_set(model, test_set)
     
     logger.info(f"Accuracy for Naive Bayes: {accuracy:.4f}")
     logger.info(f"Classification Report for Naive Bayes:\n{report}")
     
     return model, accuracy
 
-def main(train_filepath, test_filepath, model_filepath):
-    """Main function to load data, train Naive Bayes model, and save the model."""
+def export_compact_pipeline(classifier, compact_directory):
+    """Export the pipeline as a compact artifact; if it cannot be exported, remove the previous export,
+    which no longer matches the pipeline, so that it cannot be served in its place."""
+    logger.info(f"Exporting the pipeline as a compact artifact to {compact_directory}")
+    try:
+        export_compact(classifier, compact_directory)
+    except ValueError as e:
+        if os.path.exists(compact_directory):
+            shutil.rmtree(compact_directory)
+            logger.warning(f"Removed the stale compact artifact {compact_directory}: {e}")
+        else:
+            logger.warning(f"Skipped the compact artifact: {e}")
+
+def main(train_filepath, test_filepath, model_filepath, vectorizer_filepath, pipeline_filepath,
+         rebalance_strategy='smote', compact_directory=None):
+    """Main function to load data, train Naive Bayes model, and save the model and serving pipeline."""
     
-    # Load the training and testing datasets from pkl files
-    logger.info(f"Loading training data from {train_filepath}")
-    X_train, y_train = joblib.load(train_filepath)
+    # Open the training and testing feature sets; their arrays are memory-mapped, not read up front
+    logger.info(f"Opening training features from {train_filepath}")
+    train_set = open_feature_set(train_filepath)
+    logger.info(f"Training features: {matrix_memory(train_set.X)}")
 
-    logger.info(f"Loading testing data from {test_filepath}")
-    X_test, y_test = joblib.load(test_filepath)
+    logger.info(f"Opening testing features from {test_filepath}")
+    test_set = open_feature_set(test_filepath)
+    logger.info(f"Testing features: {matrix_memory(test_set.X)}")
+
+    # Rebalance the classes of the training fold only, so no made-up rows reach the test set
+    logger.info(f"Rebalancing the training fold with the '{rebalance_strategy}' strategy")
+    with instrumentation.span('rebalance', items=len(train_set)):
+        X_train, y_train, sample_weight = rebalance(train_set.X, train_set.y, rebalance_strategy)
+    logger.info(f"Rebalanced training features: {matrix_memory(X_train)}")
 
     # Train Naive Bayes model
-    model, accuracy = train_naive_bayes(X_train, y_train, X_test, y_test)
+    model, accuracy = train_naive_bayes(X_train, y_train, test_set, sample_weight)
 
     # Save the trained model to disk
     logger.info(f"Saving the Naive Bayes model with accuracy {accuracy:.4f} to {model_filepath}")
     joblib.dump(model, model_filepath)
 
+    # Bundle the preprocessing and vectorizer used to build the features with the model,
+    # so that inference transforms emails exactly as the training data was transformed
+    logger.info(f"Loading the fitted vectorizer from {vectorizer_filepath}")
+    vectorizer = joblib.load(vectorizer_filepath)
+
+    logger.info(f"Saving the preprocessing, vectorizer and model pipeline to {pipeline_filepath}")
+    classifier = SpamClassifier(Preprocessor(), vectorizer, model)
+    classifier.save(pipeline_filepath)
+
+    if compact_directory:
+        export_compact_pipeline(classifier, compact_directory)
+
 if __name__ == '__main__':
     load_dotenv(find_dotenv())
+    instrumentation.configure_from_env()
 
     # Define file paths
-    train_filepath = os.getenv('TRAIN_FILE', 'data/processed/train_data.pkl')
-    test_filepath = os.getenv('TEST_FILE', 'data/processed/test_data.pkl')
+    train_filepath = os.getenv('TRAIN_FILE', 'data/processed/train_features')
+    test_filepath = os.getenv('TEST_FILE', 'data/processed/test_features')
     model_filepath = os.getenv('MODEL_FILE', 'models/spam_classifier_model.pkl')
+    vectorizer_filepath = os.getenv('VECTORIZER_FILE', 'models/tfidf_vectorizer.pkl')
+    pipeline_filepath = os.getenv('PIPELINE_FILE', 'models/spam_pipeline.pkl')
+    rebalance_strategy = os.getenv('REBALANCE_STRATEGY', 'smote')  # 'none', 'class_weight', 'random' or 'smote'
+    compact_directory = os.getenv('COMPACT_PIPELINE')
 
     # Execute the main function
-    main(train_filepath, test_filepath, model_filepath)
+    main(train_filepath, test_filepath, model_filepath, vectorizer_filepath, pipeline_filepath, rebalance_strategy,
+         compact_directory)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import click
+import joblib
+import logging
+import pandas as pd
+from dotenv import load_dotenv, find_dotenv
+
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# Importing train_model also configures logging to logs/model_training.log
+from src.models.train_model import evaluate_feature_set, export_compact_pipeline
+from src.features.feature_store import open_feature_set
+from src.models.pipeline import SpamClassifier
+from src import instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+def update_classifier(classifier, input_filepath, batch_size):
+    """Stream labelled emails from a CSV (Body and Label columns) into the classifier in mini-batches."""
+    updated = 0
+    for chunk in pd.read_csv(input_filepath, usecols=['Body', 'Label'], chunksize=batch_size):
+        classifier.partial_fit(chunk['Body'].fillna('').tolist(), chunk['Label'].tolist())
+        updated += len(chunk)
+        logger.info(f"Folded in {updated} emails")
+    return updated
+
+
+@click.command()
+@click.argument('input_filepath', type=click.Path(exists=True))
+@click.option('--batch-size', default=1000, show_default=True, type=click.IntRange(min=1),
+              help='Number of emails per partial_fit mini-batch.')
+def main(input_filepath, batch_size):
+    """ Folds newly labelled emails (a CSV like parsed_emails.csv) into the trained pipeline
+        with partial_fit, instead of retraining on the whole corpus.
+    """
+    pipeline_filepath = os.getenv('PIPELINE_FILE', 'models/spam_pipeline.pkl')
+    model_filepath = os.getenv('MODEL_FILE', 'models/spam_classifier_model.pkl')
+    test_filepath = os.getenv('TEST_FILE', 'data/processed/test_features')
+    compact_directory = os.getenv('COMPACT_PIPELINE')
+
+    classifier = SpamClassifier.load(pipeline_filepath)
+    if not classifier.supports_partial_fit:
+        raise click.ClickException("The pipeline uses a fitted vocabulary; rebuild the features with "
+                                   "FEATURE_BACKEND=hashing and retrain before updating incrementally")
+
+    logger.info(f"Updating the model with emails from {input_filepath}")
+    updated = update_classifier(classifier, input_filepath, batch_size)
+
+    if os.path.exists(test_filepath):
+        accuracy, report = evaluate_feature_set(classifier.model, open_feature_set(test_filepath))
+        logger.info(f"Accuracy after the update: {accuracy:.4f}")
+        logger.info(f"Classification Report after the update:\n{report}")
+
+    logger.info(f"Saving the model updated with {updated} emails to {model_filepath} and {pipeline_filepath}")
+    joblib.dump(classifier.model, model_filepath)
+    classifier.save(pipeline_filepath)
+
+    # Keep the compact export in step with the updated pickle, or remove it if it cannot be
+    if compact_directory:
+        export_compact_pipeline(classifier, compact_directory)
+
+
+if __name__ == '__main__':
+    load_dotenv(find_dotenv())
+    instrumentation.configure_from_env()
+
+    # Click command handles the arguments
+    main()
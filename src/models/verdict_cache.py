@@ -0,0 +1,67 @@
+import threading
+import numpy as np
+from collections import deque
+
+from src import instrumentation
+from src.features.near_duplicates import NearDuplicateIndex
+from src.models.prediction import PredictionMixin
+
+
+class NearDuplicateVerdictCache(PredictionMixin):
+    """Wraps a classifier so that near-duplicates of recently scored emails reuse their probabilities.
+
+    Spam campaigns send the same body with small variations; once one copy has been scored, the
+    others are answered from a MinHash index of preprocessed bodies without being vectorized or
+    scored. The `max_entries` most recently scored bodies are indexed. Thread-safe.
+    """
+
+    def __init__(self, classifier, max_entries=100_000, threshold=0.8):
+        self.classifier = classifier
+        self.max_entries = max_entries
+        self.index = NearDuplicateIndex(threshold)
+        self._entries = deque()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def classes_(self):
+        return self.classifier.classes_
+
+    def preprocess(self, email_bodies):
+        return self.classifier.preprocess(email_bodies)
+
+    def predict_proba_processed(self, processed_bodies):
+        """Score preprocessed bodies with the wrapped classifier, bypassing the cache."""
+        return self.classifier.predict_proba_processed(processed_bodies)
+
+    def predict_proba_batch(self, email_bodies):
+        """Return the class probabilities of a list of email bodies, scoring only those not seen before."""
+        processed_bodies = self.classifier.preprocess(email_bodies)
+        signatures = [self.index.signature(processed_body) for processed_body in processed_bodies]
+
+        probabilities = [None] * len(email_bodies)
+        with self._lock:
+            for i, signature in enumerate(signatures):
+                if signature is not None:
+                    match = self.index.query(signature)
+                    if match is not None:
+                        probabilities[i] = match[0]
+
+        misses = [i for i, row in enumerate(probabilities) if row is None]
+        with self._lock:
+            self.hits += len(email_bodies) - len(misses)
+            self.misses += len(misses)
+        instrumentation.count('verdict_cache_hits', len(email_bodies) - len(misses))
+        instrumentation.count('verdict_cache_misses', len(misses))
+        if misses:
+            scored = self.classifier.predict_proba_processed([processed_bodies[i] for i in misses])
+            with self._lock:
+                for i, row in zip(misses, scored):
+                    probabilities[i] = row
+                    if signatures[i] is not None:
+                        self._entries.append(self.index.add(signatures[i], row))
+                while len(self._entries) > self.max_entries:
+                    self.index.remove(self._entries.popleft())
+
+        return np.array(probabilities).reshape(len(email_bodies), len(self.classes_))
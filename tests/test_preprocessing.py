@@ -0,0 +1,78 @@
+import os
+import sys
+from functools import partial
+
+import pytest
+
+# Add the root directory to sys.path so that Python can find the src module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.features import preprocessing
+from src.features.preprocessing import Preprocessor, preprocess_email_body_nltk
+
+# A subset of NLTK's English stop words, including the halves of the contractions word_tokenize splits
+STOP_WORDS = frozenset(['i', 'me', 'my', 'you', 'your', 'we', 'it', 'is', 'are', 'was', 'be', 'the', 'a', 'an',
+                        'and', 'or', 'of', 'to', 'in', 'on', 'for', 'with', 'this', 'that', 'not', 'can', 'do',
+                        'don', 't', 's', 'will', 'won', 'now'])
+
+BODIES = [
+    # Contractions, with and without apostrophes, and those word_tokenize always splits
+    "I can't believe it's not butter! You won't regret it, don't wait.",
+    "You cannot miss this: gimme a call, we're gonna win and you gotta see it, lemme know if you wanna join",
+    "CANNOT Cannot cannot; Gonna GONNA gonna.",
+    # Underscores are word characters, so they survive punctuation stripping
+    "Visit my_site_now or reply to free_offer__2024 and __init__ _leading trailing_",
+    # Runs of punctuation, alone and between words
+    "WIN!!! $$$ 100% FREE!!! Click here -> http://example.com/?a=1&b=2 ... ...",
+    "!!!???...---***",
+    "word...word---word,,,word''word\"\"word",
+    # Non-ASCII letters and digits are kept, non-ASCII punctuation and symbols are stripped
+    "Gewinnen Sie jetzt: Straße, Größe, naïve café — «Angebot» • 50 € ‼",
+    "Ünïcödé ÉMAIL ﬁnance № ½ ٣ 中文 邮件 免费！",
+    "Emails offers prizes winners, running wins.",
+    # Whitespace only and empty
+    " \t\n\r ",
+    "",
+]
+
+
+class SuffixLemmatizer:
+    """Stand-in for WordNetLemmatizer that only strips a plural 's', so no WordNet data is needed."""
+
+    def lemmatize(self, word, pos='n'):
+        return word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word
+
+
+@pytest.fixture(autouse=True)
+def offline_nltk(monkeypatch):
+    """Run without NLTK data: no default resources, and word_tokenize without the punkt sentence splitter.
+
+    Sentence splitting cannot change the tokens of a body whose punctuation is already stripped,
+    so word_tokenize with preserve_line gives the reference's tokens without the punkt models.
+    """
+    import nltk.tokenize
+
+    def no_resources():
+        raise AssertionError("The tests must not load NLTK data")
+
+    monkeypatch.setattr(preprocessing, 'load_nltk_resources', no_resources)
+    monkeypatch.setattr(nltk.tokenize, 'word_tokenize', partial(nltk.tokenize.word_tokenize, preserve_line=True))
+
+
+@pytest.mark.parametrize('body', BODIES)
+def test_matches_nltk_reference(body):
+    lemmatizer = SuffixLemmatizer()
+    expected = preprocess_email_body_nltk(body, l=lemmatizer, stop_words=STOP_WORDS)
+    assert Preprocessor(lemmatizer, STOP_WORDS)(body) == expected
+
+
+def test_matches_nltk_reference_with_a_warm_cache():
+    preprocessor = Preprocessor(SuffixLemmatizer(), STOP_WORDS, cache_size=4)
+    for body in BODIES * 2:
+        assert preprocessor(body) == preprocess_email_body_nltk(body, l=SuffixLemmatizer(), stop_words=STOP_WORDS)
+    assert preprocessor.cache_info().hits > 0
+
+
+def test_splits_contractions_like_word_tokenize():
+    tokens = Preprocessor(SuffixLemmatizer(), STOP_WORDS).tokenize("Cannot gimme gonna gotta lemme wanna")
+    assert tokens == ['can', 'not', 'gim', 'me', 'gon', 'na', 'got', 'ta', 'lem', 'me', 'wan', 'na']